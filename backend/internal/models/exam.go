@@ -27,6 +27,7 @@ type TermPaper struct {
 	DurationMinutes int     `json:"duration_minutes"` // 60
 	TotalMarks      float64 `json:"total_marks"`      // 50
 	TotalQuestions  int     `json:"total_questions"`
+	ContentHash     *string `gorm:"uniqueIndex" json:"-"` // sha256 of the uploaded PDF; re-uploads update in place
 	CreatedAt       time.Time
 	UpdatedAt       time.Time
 	Questions       []Question `gorm:"foreignKey:PaperID;constraint:OnUpdate:CASCADE,OnDelete:CASCADE;" json:"questions,omitempty"`
@@ -35,10 +36,10 @@ type TermPaper struct {
 // Question represents an exam question
 type Question struct {
 	ID              string         `gorm:"primaryKey;type:uuid;default:gen_random_uuid()" json:"id"`
-	PaperID         string         `gorm:"type:uuid;index" json:"paper_id"`
+	PaperID         string         `gorm:"type:uuid;index;uniqueIndex:idx_questions_paper_question" json:"paper_id"`
 	QuestionNumber  int            `json:"question_number"`
-	QuestionID      string         `json:"question_id"`   // Original ID from PDF
-	QuestionType    string         `json:"question_type"` // "MCQ", "MSQ", "SA", "COMPREHENSION"
+	QuestionID      string         `gorm:"uniqueIndex:idx_questions_paper_question" json:"question_id"` // Original ID from PDF
+	QuestionType    string         `json:"question_type"`                                               // "MCQ", "MSQ", "SA", "COMPREHENSION"
 	QuestionText    string         `gorm:"type:text" json:"question_text"`
 	QuestionImage   string         `json:"question_image,omitempty"`         // URL or base64
 	Options         datatypes.JSON `gorm:"type:jsonb" json:"options"`        // [{id, text, is_correct}]
@@ -1,5 +1,6 @@
 import os
 from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
 
 load_dotenv(dotenv_path="../backend/.env") # Link to your existing backend env
 
@@ -14,15 +15,118 @@ class Config:
     DB_USER = os.getenv("DB_USER", "postgres")
     DB_PASS = os.getenv("DB_PASSWORD", "")
     DB_PORT = os.getenv("DB_PORT", "5432")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))  # 0 behind pgbouncer
     
     # ImageKit for image hosting
     IMAGEKIT_PRIVATE_KEY = os.getenv("IMAGEKIT_PRIVATE_KEY", "")
     IMAGEKIT_PUBLIC_KEY = os.getenv("IMAGEKIT_PUBLIC_KEY", "")
     IMAGEKIT_URL_ENDPOINT = os.getenv("IMAGEKIT_URL_ENDPOINT", "")
 
+    # Embedding pipeline (ingestion and /embeddings/batch)
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "50"))
+    EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+    EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+    EMBED_BACKOFF_SECONDS = float(os.getenv("EMBED_BACKOFF_SECONDS", "1.0"))
+    INGEST_FLUSH_SIZE = int(os.getenv("INGEST_FLUSH_SIZE", "500"))
+    EMBED_REQUEST_MAX_TEXTS = int(os.getenv("EMBED_REQUEST_MAX_TEXTS", "5000"))  # per /embeddings/batch request
+
+    # Embedding cache (in-process LRU + persistent SQLite file, empty path disables persistence)
+    EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "./data/embedding_cache.sqlite3")
+    EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))
+    EMBED_CACHE_TTL_SECONDS = float(os.getenv("EMBED_CACHE_TTL_SECONDS", "86400"))
+
+    # ANN index on resources.embedding ("hnsw" or "ivfflat")
+    VECTOR_INDEX_METHOD = os.getenv("VECTOR_INDEX_METHOD", "hnsw")
+    VECTOR_INDEX_AUTOCREATE = os.getenv("VECTOR_INDEX_AUTOCREATE", "false").lower() == "true"
+    HNSW_M = int(os.getenv("HNSW_M", "16"))
+    HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+    HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+    IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "0"))  # 0 = derive from row count
+    IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+    VECTOR_ITERATIVE_SCAN = os.getenv("VECTOR_ITERATIVE_SCAN", "relaxed_order")  # off | relaxed_order | strict_order
+
+    # Retrieval: "hybrid" (vector + full-text, reciprocal rank fusion) or "vector"
+    RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+    RETRIEVAL_VECTOR_K = int(os.getenv("RETRIEVAL_VECTOR_K", "20"))
+    RETRIEVAL_LEXICAL_K = int(os.getenv("RETRIEVAL_LEXICAL_K", "20"))
+    RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+
+    # Prompt assembly (token budgets are per prompt, counted with the strictest provider tokenizer)
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "800"))
+    HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "5"))
+    CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))  # shingle Jaccard
+
+    # LLM provider calls
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "2.5"))
+    LLM_HEALTH_WINDOW = int(os.getenv("LLM_HEALTH_WINDOW", "50"))
+    LLM_HEALTH_WINDOW_SECONDS = float(os.getenv("LLM_HEALTH_WINDOW_SECONDS", "300"))
+    LLM_LATENCY_EWMA_ALPHA = float(os.getenv("LLM_LATENCY_EWMA_ALPHA", "0.3"))
+    LLM_LATENCY_PRIOR_SECONDS = float(os.getenv("LLM_LATENCY_PRIOR_SECONDS", "2.0"))
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "3"))
+    LLM_CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("LLM_CIRCUIT_COOLDOWN_SECONDS", "30"))
+    LLM_CIRCUIT_MAX_COOLDOWN_SECONDS = float(os.getenv("LLM_CIRCUIT_MAX_COOLDOWN_SECONDS", "600"))
+
+    # Semantic answer cache (ChatService)
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))  # cosine similarity
+    RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "604800"))
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2000"))
+    RESPONSE_CACHE_CHECK_SECONDS = float(os.getenv("RESPONSE_CACHE_CHECK_SECONDS", "15"))
+
+    # /chat/stream framing
+    STREAM_FLUSH_SECONDS = float(os.getenv("STREAM_FLUSH_SECONDS", "0.05"))  # coalescing window for token deltas
+    STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "256"))
+    STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+
+    # Background jobs (/ingest, /admin/upload-exam)
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "20"))
+    JOB_DB_PATH = os.getenv("JOB_DB_PATH", "./data/jobs.sqlite3")
+    INGEST_EMBED_MAX_IN_FLIGHT = int(os.getenv("INGEST_EMBED_MAX_IN_FLIGHT", "2"))  # leaves embedding quota for chat
+
+    # Exam PDF parsing
+    PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", "0"))  # 0 = one per CPU, divided by WEB_CONCURRENCY
+    PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8"))
+
+    # Exam image uploads
+    IMAGE_UPLOADER = os.getenv("IMAGE_UPLOADER", "")  # imagekit | local | none (default: imagekit if keyed)
+    IMAGE_UPLOAD_CONCURRENCY = int(os.getenv("IMAGE_UPLOAD_CONCURRENCY", "8"))
+    IMAGE_UPLOAD_MAX_RETRIES = int(os.getenv("IMAGE_UPLOAD_MAX_RETRIES", "3"))
+    IMAGE_UPLOAD_BACKOFF_SECONDS = float(os.getenv("IMAGE_UPLOAD_BACKOFF_SECONDS", "0.5"))
+    IMAGE_UPLOAD_LOCAL_DIR = os.getenv("IMAGE_UPLOAD_LOCAL_DIR", "./data/uploads")
+    IMAGE_UPLOAD_LOCAL_URL = os.getenv("IMAGE_UPLOAD_LOCAL_URL", "")
+
+    # Multi-worker mode: `python main.py` runs WEB_CONCURRENCY uvicorn worker processes that share
+    # provider health and the response cache through SHARED_STATE_PATH (the embedding cache is already shared via EMBED_CACHE_PATH)
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+    SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "./data/shared_state.sqlite3" if WEB_CONCURRENCY > 1 else "")
+    SHARED_STATE_SYNC_SECONDS = float(os.getenv("SHARED_STATE_SYNC_SECONDS", "1.0"))  # how stale a worker's view may get
+
+    # Service start-up: services are built lazily; these are built in the background at startup
+    WARM_ON_STARTUP = os.getenv("WARM_ON_STARTUP", "")  # comma list: chat, ingestion, image_upload, pdf_pool
+    WARM_DATABASE_ON_STARTUP = os.getenv("WARM_DATABASE_ON_STARTUP", "true").lower() == "true"
+
     @classmethod
     def get_sqlalchemy_url(cls):
         if cls.DATABASE_URL:
             # Handle neon/postgres strings
             return cls.DATABASE_URL.replace("postgres://", "postgresql://")
         return f"postgresql://{cls.DB_USER}:{cls.DB_PASS}@{cls.DB_HOST}:{cls.DB_PORT}/{cls.DB_NAME}"
+
+    @classmethod
+    def get_async_sqlalchemy_url(cls):
+        """asyncpg URL plus connect_args (asyncpg takes `ssl`, not libpq's sslmode/channel_binding)."""
+        url = make_url(cls.get_sqlalchemy_url()).set(drivername="postgresql+asyncpg")
+        query = dict(url.query)
+        connect_args = {}
+        sslmode = query.pop("sslmode", None)
+        query.pop("channel_binding", None)
+        if sslmode and sslmode != "disable":
+            connect_args["ssl"] = sslmode
+        return url.set(query=query).render_as_string(hide_password=False), connect_args
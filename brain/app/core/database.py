@@ -0,0 +1,137 @@
+"""
+Database
+One process-wide pooled database layer shared by chat, ingestion and exam
+upload: a sync psycopg2 engine, an async asyncpg engine and pooled raw
+DBAPI connections. Engines are created on first use and warmed at startup.
+"""
+
+import time
+import logging
+import threading
+from typing import Dict
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_engine = None
+_async_engine = None
+_metrics: Dict[str, Dict] = {}
+
+
+def _instrument(name: str, sync_engine):
+    """Count new connections and checkouts, and the peak number of connections checked out."""
+    metrics = _metrics.setdefault(name, {"connects": 0, "checkouts": 0, "max_checked_out": 0})
+
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics["connects"] += 1
+
+    @event.listens_for(sync_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics["checkouts"] += 1
+        metrics["max_checked_out"] = max(metrics["max_checked_out"], sync_engine.pool.checkedout())
+
+
+def get_engine():
+    """Shared sync engine (psycopg2) for ingestion, scripts and exam upload."""
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                url = make_url(Config.get_sqlalchemy_url()).set(drivername="postgresql+psycopg2")
+                _engine = create_engine(
+                    url,
+                    pool_size=Config.DB_POOL_SIZE,
+                    max_overflow=Config.DB_MAX_OVERFLOW,
+                    pool_timeout=Config.DB_POOL_TIMEOUT,
+                    pool_recycle=Config.DB_POOL_RECYCLE,
+                    pool_pre_ping=True,
+                )
+                _instrument("sync", _engine)
+    return _engine
+
+
+def get_async_engine():
+    """
+    Shared async engine (asyncpg) for the chat path. asyncpg prepares every
+    statement server-side and SQLAlchemy keeps a per-connection cache of them,
+    so the hot similarity query is parsed and planned once per connection.
+    Set DB_STATEMENT_CACHE_SIZE=0 behind a transaction-mode pooler (pgbouncer).
+    """
+    global _async_engine
+    if _async_engine is None:
+        with _lock:
+            if _async_engine is None:
+                url, connect_args = Config.get_async_sqlalchemy_url()
+                url = make_url(url).update_query_dict(
+                    {"prepared_statement_cache_size": str(Config.DB_STATEMENT_CACHE_SIZE)}
+                )
+                if Config.DB_STATEMENT_CACHE_SIZE == 0:
+                    connect_args["statement_cache_size"] = 0
+                _async_engine = create_async_engine(
+                    url,
+                    connect_args=connect_args,
+                    pool_size=Config.DB_POOL_SIZE,
+                    max_overflow=Config.DB_MAX_OVERFLOW,
+                    pool_timeout=Config.DB_POOL_TIMEOUT,
+                    pool_recycle=Config.DB_POOL_RECYCLE,
+                    pool_pre_ping=True,
+                )
+                _instrument("async", _async_engine.sync_engine)
+    return _async_engine
+
+
+def get_db_connection():
+    """
+    Pooled raw psycopg2 connection. `close()` returns it to the pool instead of
+    tearing down the TCP/TLS session.
+    """
+    return get_engine().raw_connection()
+
+
+async def init_database():
+    """Create both engines and open one connection each so the first request skips the handshake."""
+    started = time.perf_counter()
+    try:
+        with get_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+        async with get_async_engine().connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        logger.info(f"✅ Database pools ready in {(time.perf_counter() - started) * 1000:.0f}ms")
+    except Exception as e:
+        logger.warning(f"⚠️ Database warm-up failed: {e}")
+
+
+async def dispose_database():
+    global _engine, _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+
+
+def pool_stats() -> Dict:
+    stats = {}
+    for name, engine in (("sync", _engine), ("async", _async_engine.sync_engine if _async_engine else None)):
+        if engine is None:
+            continue
+        pool = engine.pool
+        capacity = Config.DB_POOL_SIZE + Config.DB_MAX_OVERFLOW
+        stats[name] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "capacity": capacity,
+            "saturation": round(pool.checkedout() / capacity, 3) if capacity else 0.0,
+            **_metrics.get(name, {}),
+        }
+    return stats
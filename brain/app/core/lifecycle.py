@@ -0,0 +1,124 @@
+"""
+Lifecycle
+Lazy service construction for the API process. Services are registered by
+import path ("module:attr") and only imported and built on first use, or
+when warmed at startup / via /ready, so a worker that only serves /chat never
+loads pdfplumber or the ImageKit SDK. Import and build times are recorded for
+the startup profile.
+"""
+
+import time
+import asyncio
+import logging
+import importlib
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LazyService:
+    def __init__(self, name: str, target: str, *args, **kwargs):
+        self.name = name
+        self.target = target  # "package.module:factory"
+        self.args = args
+        self.kwargs = kwargs
+        self.import_seconds: Optional[float] = None
+        self.build_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self._instance = None
+        self._built = False
+        self._lock = threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        return self._built
+
+    @property
+    def instance(self) -> Any:
+        """The built service, or None if it has not been built yet (never builds)."""
+        return self._instance
+
+    def get(self) -> Any:
+        """Build on first call (thread-safe; concurrent callers wait for the one build)."""
+        if self._built:
+            return self._instance
+        with self._lock:
+            if self._built:
+                return self._instance
+            module_name, _, attr = self.target.partition(":")
+            started = time.perf_counter()
+            try:
+                factory: Callable = getattr(importlib.import_module(module_name), attr)
+                imported = time.perf_counter()
+                instance = factory(*self.args, **self.kwargs)
+            except Exception as e:
+                self.error = str(e)
+                logger.error(f"❌ Could not build {self.name} ({self.target}): {e}")
+                raise
+            finished = time.perf_counter()
+            self.import_seconds = imported - started
+            self.build_seconds = finished - imported
+            self.error = None
+            self._instance, self._built = instance, True
+            logger.info(f"🧩 {self.name} ready in {(finished - started) * 1000:.0f}ms "
+                        f"(import {self.import_seconds * 1000:.0f}ms, build {self.build_seconds * 1000:.0f}ms)")
+            return instance
+
+    async def aget(self) -> Any:
+        """get() for async handlers: a first build runs in a thread so the event loop keeps serving."""
+        if self._built:
+            return self._instance
+        return await asyncio.to_thread(self.get)
+
+    def status(self) -> Dict:
+        return {
+            "built": self._built,
+            "import_ms": round(self.import_seconds * 1000, 1) if self.import_seconds is not None else None,
+            "build_ms": round(self.build_seconds * 1000, 1) if self.build_seconds is not None else None,
+            "error": self.error,
+        }
+
+
+class ServiceRegistry:
+    def __init__(self):
+        self._services: Dict[str, LazyService] = {}
+        self.phases: Dict[str, float] = {}  # startup phase -> seconds
+
+    def register(self, name: str, target: str, *args, **kwargs) -> LazyService:
+        service = self._services[name] = LazyService(name, target, *args, **kwargs)
+        return service
+
+    def __getitem__(self, name: str) -> LazyService:
+        return self._services[name]
+
+    def names(self) -> List[str]:
+        return list(self._services)
+
+    def record(self, phase: str, seconds: float):
+        self.phases[phase] = seconds
+
+    async def warm(self, names: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Build the named services concurrently; returns name -> error (None when ready)."""
+        names = [name for name in names if name]
+        unknown = [name for name in names if name not in self._services]
+        if unknown:
+            raise KeyError(f"Unknown services: {', '.join(unknown)} (known: {', '.join(self._services)})")
+        results = await asyncio.gather(*(self._services[name].aget() for name in names), return_exceptions=True)
+        return {name: str(result) if isinstance(result, Exception) else None for name, result in zip(names, results)}
+
+    def profile(self) -> Dict:
+        return {
+            "phases_ms": {phase: round(seconds * 1000, 1) for phase, seconds in self.phases.items()},
+            "services": {name: service.status() for name, service in self._services.items()},
+        }
+
+    def log_profile(self):
+        phases = ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.phases.items())
+        built = [name for name, service in self._services.items() if service.built]
+        logger.info(f"⏱️ Startup profile: {phases}; built: {', '.join(built) or 'none (lazy)'}")
+
+
+def parse_names(value: Optional[str]) -> List[str]:
+    """"chat, ingestion" -> ["chat", "ingestion"]."""
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
@@ -0,0 +1,145 @@
+"""
+Shared State
+Cross-process state for multi-worker deployments (WEB_CONCURRENCY > 1): a
+SQLite file in WAL mode that every worker on the host opens. It holds small
+JSON values (provider health) under a cross-process write lock, and an
+append-only event log per channel (response cache entries) that workers
+replay to converge on the same contents. Disabled (None) when
+SHARED_STATE_PATH is empty; callers then keep state in-process only.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SharedStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            db = self._db()
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS kv (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    channel TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS idx_events_channel ON events (channel, seq)")
+
+    def _db(self) -> sqlite3.Connection:
+        """One connection per process; a connection inherited across fork is never reused."""
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._conn
+
+    @contextmanager
+    def locked(self) -> Iterator["SharedStore"]:
+        """
+        Cross-process critical section (BEGIN IMMEDIATE takes the database
+        write lock) for read-modify-write of shared values.
+        """
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._db().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_prefix(self, prefix: str) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT key, value FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, json.dumps(value, default=str), time.time())
+            )
+
+    def publish(self, channel: str, data: Dict) -> int:
+        with self._lock:
+            cur = self._db().execute(
+                "INSERT INTO events (channel, data, created_at) VALUES (?, ?, ?)",
+                (channel, json.dumps(data, default=str), time.time()),
+            )
+            return cur.lastrowid
+
+    def read(self, channel: str, after: int = 0, limit: int = 10000) -> List[Tuple[int, Dict]]:
+        """Events on `channel` with seq > after, oldest first."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT seq, data FROM events WHERE channel = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (channel, after, limit),
+            ).fetchall()
+        return [(seq, json.loads(data)) for seq, data in rows]
+
+    def trim(self, channel: str, before_seq: Optional[int] = None, older_than: Optional[float] = None) -> int:
+        """Drop events below a seq or created before a wall-clock time (either condition suffices)."""
+        conditions, params = [], [channel]
+        if before_seq is not None:
+            conditions.append("seq < ?")
+            params.append(before_seq)
+        if older_than is not None:
+            conditions.append("created_at < ?")
+            params.append(older_than)
+        if not conditions:
+            return 0
+        with self._lock:
+            return self._db().execute(
+                f"DELETE FROM events WHERE channel = ? AND ({' OR '.join(conditions)})", params
+            ).rowcount
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_shared_store() -> Optional[SharedStore]:
+    """Process-wide store for SHARED_STATE_PATH, or None when state is kept per process."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = Config.SHARED_STATE_PATH
+            _store = False
+            if path:
+                try:
+                    _store = SharedStore(path)
+                    logger.info(f"🤝 Shared worker state at {path}")
+                except Exception as e:
+                    logger.warning(f"⚠️ Shared state disabled ({path}): {e}")
+        return _store or None
@@ -3,11 +3,39 @@ from llama_index.llms.groq import Groq
 from llama_index.llms.cerebras import Cerebras
 from llama_index.embeddings.gemini import GeminiEmbedding
 from app.core.config import Config
-from sqlalchemy import create_engine, text
+from app.services.embeddings import is_rate_limit_error
+from app.services.embedding_cache import CachedEmbedding
+from app.services.retrieval import Retriever
+from app.services.providers import ProviderRouter
+from app.services.response_cache import ResponseCache
+from app.services.context import ContextBuilder, TokenCounter
+from app.services.prompts import CHAT_PROMPT, GREETING_ANSWER, is_greeting, cached_prompt_tokens
+from app.services.streaming import event, encode_text
+from app.services.singleflight import SingleFlight, request_key
+from app.core.database import get_engine, get_async_engine
+from app.core.shared_state import get_shared_store
+import re
+import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# API endpoints resolved ahead of the LLM call while the query is being embedded
+PROVIDER_HOSTS = {
+    "Gemini 2.0 Flash": "generativelanguage.googleapis.com",
+    "Groq Llama 3.3 70B": "api.groq.com",
+    "Cerebras Llama 3.3 70B": "api.cerebras.ai",
+}
+PROVIDER_WARM_UP_INTERVAL = 60.0
+
+
+def replay_chunks(answer, words_per_chunk=8):
+    """Split a cached answer into word groups so it streams like a live response."""
+    words = re.findall(r"\S+\s*|\s+", answer)
+    for i in range(0, len(words), words_per_chunk):
+        yield "".join(words[i:i + words_per_chunk])
+
 class ChatService:
     def __init__(self):
         self.llm_providers = []  # List of (llm_instance, provider_name)
@@ -42,191 +70,304 @@ class ChatService:
         if not self.llm_providers:
             logger.error("❌ No LLM providers configured!")
         
+        # Health tracking + circuit breaking across providers (shared by all workers when SHARED_STATE_PATH is set)
+        self.router = ProviderRouter(self.llm_providers, shared=get_shared_store())
+        
         # Embeddings (still use Gemini - it's separate quota)
-        self.embed_model = GeminiEmbedding(model_name="models/text-embedding-004", api_key=Config.GEMINI_API_KEY)
-        self.engine = create_engine(Config.get_sqlalchemy_url())
+        self.embed_model = CachedEmbedding(GeminiEmbedding(model_name="models/text-embedding-004", api_key=Config.GEMINI_API_KEY))
+        self.engine = get_engine()
+        self.async_engine = get_async_engine()
+        
+        # Filtered vector search; ANN knobs (hnsw.ef_search / ivfflat.probes) are overridable per query
+        self.retriever = Retriever(self.engine, async_engine=self.async_engine)
+        
+        # Hedged provider calls: fire the next provider if no first token within hedge_delay
+        self.hedge = Config.LLM_HEDGE_ENABLED
+        self.hedge_delay = Config.LLM_HEDGE_DELAY_SECONDS
+        self._last_warm_up = 0.0
+        self._background_tasks = set()
+        
+        # Semantic answer cache (invalidated when `resources` changes)
+        self.response_cache = ResponseCache(shared=get_shared_store())
+        
+        # Token-budgeted context + history packing
+        self.context_builder = ContextBuilder(TokenCounter([name for _, name in self.llm_providers]))
+        # Identical questions arriving while one is being answered share its embedding, search and LLM call
+        self.ask_flights = SingleFlight("chat")
+        self.stream_flights = SingleFlight("chat stream")
+        logger.info(f"📝 Chat prompt prefix {CHAT_PROMPT.prefix_hash} ({len(CHAT_PROMPT.prefix)} chars, cacheable)")
 
     def _is_rate_limit_error(self, error):
         """Check if an error is a rate limit/quota error."""
-        error_str = str(error).lower()
-        return any(x in error_str for x in ["429", "quota", "rate", "limit", "exceeded", "resource_exhausted"])
+        return is_rate_limit_error(error)
 
-    def _call_with_fallback(self, prompt, stream=False):
-        """Try each LLM provider in order, fallback on rate limit errors."""
+    async def _start_provider(self, llm, name, prompt, stream):
+        """Call one provider; for streams, resolve once the first chunk has arrived."""
+        logger.info(f"🔄 Trying {name}...")
+        started = time.perf_counter()
+        try:
+            if not stream:
+                response = await llm.acomplete(prompt)
+                await self.router.arecord_success(name, time.perf_counter() - started)
+                return response
+            
+            # For streaming, we need to try getting first chunk to detect errors
+            stream_gen = await llm.astream_complete(prompt)
+            first_chunk = None
+            try:
+                first_chunk = await stream_gen.__anext__()
+            except StopAsyncIteration:
+                pass
+        except asyncio.CancelledError:
+            # Hedge loser or client gone: no verdict on the provider's health
+            await self.router.arelease(name)
+            raise
+        except Exception as e:
+            await self.router.arecord_failure(name, e)
+            raise
+        # Latency for streams is time to first token
+        await self.router.arecord_success(name, time.perf_counter() - started)
+        
+        # If we got here, provider works. Return a generator that includes first chunk
+        async def gen_with_first(first, rest):
+            if first is not None:
+                yield first
+            async for chunk in rest:
+                yield chunk
+        
+        return gen_with_first(first_chunk, stream_gen)
+
+    async def _call_with_fallback(self, prompt, stream=False, hedge=None):
+        """
+        Try each LLM provider in router order (fastest healthy first), fallback on errors.
+        Providers whose circuit is open are skipped without a call.
+        
+        In hedged mode, if the current provider has not produced its first token
+        (or its completion, when not streaming) within `hedge_delay` seconds, the
+        next provider is started as well and whichever answers first wins.
+        """
+        hedge = self.hedge if hedge is None else hedge
+        providers = iter(await self.router.aordered())
+        pending = {}  # task -> provider name
         last_error = None
         
-        for llm, name in self.llm_providers:
-            try:
-                logger.info(f"🔄 Trying {name}...")
-                if stream:
-                    # For streaming, we need to try getting first chunk to detect errors
-                    stream_gen = llm.stream_complete(prompt)
-                    # Try to get the first item to catch immediate errors
-                    first_chunk = None
-                    try:
-                        first_chunk = next(iter(stream_gen))
-                    except StopIteration:
-                        pass
-                    except Exception as e:
-                        raise e  # Re-raise to be caught by outer try
-                    
-                    # If we got here, provider works. Return a generator that includes first chunk
-                    def gen_with_first(first, rest):
-                        if first is not None:
-                            yield first
-                        for chunk in rest:
-                            yield chunk
-                    
-                    return gen_with_first(first_chunk, stream_gen), name
-                else:
-                    return llm.complete(prompt), name
-            except Exception as e:
-                last_error = e
-                if self._is_rate_limit_error(e):
-                    logger.warning(f"⚠️ {name} rate limited, trying next provider...")
+        async def launch_next():
+            for llm, name in providers:
+                if not await self.router.atry_acquire(name):
+                    logger.info(f"⏭️ Skipping {name} (circuit open)")
                     continue
-                else:
-                    logger.warning(f"⚠️ {name} error: {e}, trying next provider...")
+                pending[asyncio.create_task(self._start_provider(llm, name, prompt, stream))] = name
+                return True
+            return False
+        
+        await launch_next()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, timeout=self.hedge_delay if hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Deadline passed without a first token: fire a backup provider
+                    if await launch_next():
+                        logger.warning(f"⏱️ No first token after {self.hedge_delay}s, hedging with next provider...")
                     continue
+                
+                winner = None
+                for task in done:
+                    name = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_error = e
+                        if self._is_rate_limit_error(e):
+                            logger.warning(f"⚠️ {name} rate limited, trying next provider...")
+                        else:
+                            logger.warning(f"⚠️ {name} error: {e}, trying next provider...")
+                        continue
+                    if winner is None:
+                        winner = (result, name)
+                    elif stream:
+                        await result.aclose()
+                
+                if winner:
+                    return winner
+                if not pending:
+                    await launch_next()
+        finally:
+            for task in pending:
+                task.cancel()
         
+        if last_error is None:
+            raise Exception("All LLM providers are unavailable (circuits open), please retry shortly")
         raise Exception(f"All LLM providers failed! Last error: {last_error}")
 
-    def ask(self, query, category="all", history=None):
+    async def _warm_up_providers(self):
+        """Resolve provider endpoints ahead of the LLM call (cached for a while)."""
+        now = time.monotonic()
+        if now - self._last_warm_up < PROVIDER_WARM_UP_INTERVAL:
+            return
+        self._last_warm_up = now
+        loop = asyncio.get_running_loop()
+        hosts = [PROVIDER_HOSTS[name] for _, name in self.llm_providers[:2] if name in PROVIDER_HOSTS]
+        await asyncio.gather(*(loop.getaddrinfo(host, 443) for host in hosts), return_exceptions=True)
+
+    async def _prepare(self, query, history):
+        """
+        Embedding, history packing and provider warm-up run concurrently;
+        everything after this point needs the query embedding.
+        """
+        embed_task = asyncio.create_task(self.embed_model.aget_text_embedding(query))
+        warm_task = asyncio.create_task(self._warm_up_providers())
+        self._background_tasks.add(warm_task)
+        warm_task.add_done_callback(self._background_tasks.discard)
+        await asyncio.sleep(0)  # let both tasks send their requests before the CPU-bound packing below
+        packed_history = self.context_builder.pack_history(history)
+        query_embedding = await embed_task
+        return query_embedding, packed_history
+
+    async def _cached_answer(self, query_embedding, scope, history):
+        """Semantic cache lookup. Only first-turn questions are cached, later turns depend on history."""
+        if history:
+            return None
+        await self.response_cache.refresh(self.async_engine)
+        cached = await self.response_cache.alookup(query_embedding, scope)
+        if cached:
+            logger.info(f"⚡ Semantic cache hit (scope={scope})")
+        return cached
+
+    async def ask(self, query, category="all", history=None, subject=None, year=None, ef_search=None, probes=None):
         # 1. Greeting Check
-        greetings = ["hi", "hello", "hey", "who are you", "what is your name"]
-        if query.lower().strip().rstrip("?") in greetings:
-            return {
-                "answer": "Hello and Welcome. My name is Spirit, and I'm thrilled to be your academic mentor. I'm here to support and guide you throughout your learning journey, providing you with helpful insights, explanations, and resources to help you succeed.\n\nPlease feel free to ask me any questions, share your concerns, or discuss topics that interest you. I'm all ears and ready to help. What's on your mind today?",
-                "sources": []
-            }
+        if is_greeting(query):
+            return {"answer": GREETING_ANSWER, "sources": []}
 
+        key = request_key(query, category, history, subject=subject, year=year, ef_search=ef_search, probes=probes)
+        return await self.ask_flights.do(
+            key, lambda: self._ask(query, category, history, subject, year, ef_search, probes)
+        )
+
+    async def _ask(self, query, category, history, subject, year, ef_search, probes):
         try:
-            # 2. Embedding
-            query_embedding = self.embed_model.get_text_embedding(query)
-            
-            # 3. Search
-            search_query = text("""
-                SELECT content, category, title 
-                FROM resources 
-                ORDER BY embedding <=> :embedding 
-                LIMIT 5
-            """)
+            # 2. Embedding (history packed while the embedding is in flight)
+            query_embedding, packed_history = await self._prepare(query, history)
             
-            with self.engine.connect() as conn:
-                results = conn.execute(search_query, {"embedding": str(query_embedding).replace(" ", "")}).fetchall()
+            # 3. Semantic answer cache
+            scope = (category, subject, year)
+            cached = await self._cached_answer(query_embedding, scope, history)
+            if cached:
+                return {"answer": cached.answer, "sources": cached.sources}
             
-            # 4. Context
-            context = ""
-            for r in results:
-                context += f"SOURCE: {r.content}\n---\n"
+            # 4. Search
+            results = await self.retriever.asearch(
+                query_embedding, category=category, subject=subject, year=year,
+                ef_search=ef_search, probes=probes, query_text=query
+            )
             
-            # 5. History Formatting
-            history_str = ""
-            if history:
-                for h in history[-5:]:
-                    role = "STUDENT" if h.get('role') == 'user' else "SPIRIT"
-                    history_str += f"{role}: {h.get('content')}\n"
-
-            # 6. Improved Prompt
-            prompt = f"""
-            You are Spirit, a warm, supportive, and highly knowledgeable academic mentor. You are not just an AI answering questions; you are a partner in the student's learning journey.
-
-            CORE PERSONA:
-            - **Human & Natural**: Speak like a helpful professor or a brilliant senior student. Avoid robotic phrases.
-            - **Supportive**: Validate the student's efforts and feelings.
-            - **Clear & Structured**: Use Markdown (bold, lists) for clarity.
-            - **Context-Aware**: Use CONTEXT naturally without explicitly mentioning it.
-
-            INSTRUCTIONS:
-            - **Prioritize Context**: Use CONTEXT information if relevant.
-            - **General Knowledge**: Answer general questions fully.
-            - **No Meta-Talk**: Do not reference "context", "files", or "documents".
-            - Provide detailed, helpful answers with Markdown.
-            
-            CONVERSATION HISTORY:
-            {history_str}
-            
-            CONTEXT FROM ACADEMIC DOCS:
-            {context}
-            
-            STUDENT QUESTION: {query}
-            """
+            # 5. Context (deduplicated and packed into the token budget)
+            packed = self.context_builder.pack_chunks(results)
+            history_str, context, results = packed_history.text, packed.text, packed.results
+
+            # 6. Prompt: byte-stable static prefix, dynamic sections after it
+            prompt = CHAT_PROMPT.render(history=history_str, context=context, question=query)
             
-            response, provider = self._call_with_fallback(prompt, stream=False)
-            logger.info(f"✅ Response from {provider}")
+            self.context_builder.report(prompt, packed_history, packed)
+            response, provider = await self._call_with_fallback(prompt, stream=False)
+            cached_tokens = cached_prompt_tokens(response)
+            logger.info(f"✅ Response from {provider}" + (f" ({cached_tokens} prompt tokens from prefix cache)" if cached_tokens else ""))
+            sources = [{"content": r.content[:100], "category": r.category, "title": r.title} for r in results]
+            if not history:
+                await self.response_cache.astore(query_embedding, scope, response.text, sources)
             return {
                 "answer": response.text,
-                "sources": [{"content": r.content[:100], "category": r.category, "title": r.title} for r in results]
+                "sources": sources
             }
         except Exception as e:
             logger.error(f"❌ BRAIN ERROR: {str(e)}")
             return {"answer": f"I encountered a slight technical hiccup: {str(e)}", "sources": []}
 
-    def stream_ask(self, query, category="all", history=None):
+    async def stream_events(self, query, category="all", history=None, subject=None, year=None, ef_search=None, probes=None):
+        """
+        Typed events for /chat/stream: provider, sources, token..., usage, done
+        (or error, done). See app/services/streaming.py for the wire formats.
+        """
+        started = time.perf_counter()
+        
         # 1. Greeting Check
-        greetings = ["hi", "hello", "hey", "who are you", "what is your name"]
-        if query.lower().strip().rstrip("?") in greetings:
-            yield "Hello and Welcome. My name is **Spirit**, and I'm thrilled to be your academic mentor. I'm here to support and guide you throughout your learning journey, providing you with helpful insights, explanations, and resources to help you succeed.\n\nPlease feel free to ask me any questions, share your concerns, or discuss topics that interest you. I'm all ears and ready to help. What's on your mind today?"
+        if is_greeting(query):
+            yield event("provider", name="greeting", cached=True)
+            yield event("token", text=GREETING_ANSWER)
+            yield event("done")
             return
 
+        # Subscribers to an identical in-flight question replay its events so far, then follow it live
+        key = request_key(query, category, history, subject=subject, year=year, ef_search=ef_search, probes=probes)
+        async for item in self.stream_flights.stream(
+            key, lambda: self._stream_events(query, category, history, subject, year, ef_search, probes, started)
+        ):
+            yield item
+
+    async def _stream_events(self, query, category, history, subject, year, ef_search, probes, started):
         try:
-            # 2. Embedding
-            query_embedding = self.embed_model.get_text_embedding(query)
+            # 2. Embedding (history packed while the embedding is in flight)
+            query_embedding, packed_history = await self._prepare(query, history)
             
-            # 3. Search
-            search_query = text("""
-                SELECT content, category, title 
-                FROM resources 
-                ORDER BY embedding <=> :embedding 
-                LIMIT 5
-            """)
+            # 3. Semantic answer cache
+            scope = (category, subject, year)
+            cached = await self._cached_answer(query_embedding, scope, history)
+            if cached:
+                elapsed_ms = round((time.perf_counter() - started) * 1000)
+                yield event("provider", name="cache", cached=True)
+                yield event("sources", sources=cached.sources)
+                for piece in replay_chunks(cached.answer):
+                    yield event("token", text=piece)
+                yield event("usage", prompt_tokens=0, completion_tokens=self.context_builder.counter.count(cached.answer),
+                            first_token_ms=elapsed_ms, total_ms=elapsed_ms)
+                yield event("done")
+                return
             
-            with self.engine.connect() as conn:
-                results = conn.execute(search_query, {"embedding": str(query_embedding).replace(" ", "")}).fetchall()
+            # 4. Search
+            results = await self.retriever.asearch(
+                query_embedding, category=category, subject=subject, year=year,
+                ef_search=ef_search, probes=probes, query_text=query
+            )
             
-            # 4. Context
-            context = ""
-            for r in results:
-                context += f"SOURCE: {r.content}\n---\n"
-            
-            # 5. History Formatting
-            history_str = ""
-            if history:
-                for h in history[-5:]:
-                    role = "STUDENT" if h.get('role') == 'user' else "SPIRIT"
-                    history_str += f"{role}: {h.get('content')}\n"
-
-            # 6. Improved STREAMING Prompt
-            prompt = f"""
-            You are Spirit, a warm, supportive, and highly knowledgeable academic mentor. You are not just an AI answering questions; you are a partner in the student's learning journey.
-
-            CORE PERSONA:
-            - **Human & Natural**: Speak like a helpful professor or a brilliant senior student. Avoid robotic phrases like "As an AI" or "Based on the context provided".
-            - **Supportive & Encouraging**: If a student is stressed, offer reassurance along with the answer. Validate their efforts.
-            - **Clear & Structured**: Use Markdown effectively (bolding key terms, using lists) to make complex information easy to digest.
-            - **Context-Aware**: Use the provided CONTEXT to answer accurately, but integrate it naturally into your explanation.
-
-            INSTRUCTIONS:
-            - **Prioritize Context**: If the student's question relates to the CONTEXT, use that information as the primary source.
-            - **General Knowledge**: If the question is general (e.g., "how to stay motivated", "explain gravity"), use your own vast knowledge.
-            - **Formatting**: ALWAYS use Markdown to structure your response. 
-            - **No Meta-Talk**: Never mention "context blocks", "uploaded files", or "retrieved documents". Just provide the answer.
+            # 5. Context (deduplicated and packed into the token budget)
+            packed = self.context_builder.pack_chunks(results)
+            history_str, context, results = packed_history.text, packed.text, packed.results
+
+            # 6. Prompt: same template as ask(), so both share the provider's prefix cache
+            prompt = CHAT_PROMPT.render(history=history_str, context=context, question=query)
             
-            CONVERSATION HISTORY:
-            {history_str}
+            prompt_tokens = self.context_builder.report(prompt, packed_history, packed)
             
-            CONTEXT:
-            {context}
+            # Use stream_complete with fallback
+            response_stream, provider = await self._call_with_fallback(prompt, stream=True)
+            first_token_ms = round((time.perf_counter() - started) * 1000)
+            logger.info(f"✅ Streaming from {provider} (first token after {first_token_ms}ms)")
+            sources = [{"content": r.content[:100], "category": r.category, "title": r.title} for r in results]
+            yield event("provider", name=provider, cached=False)
+            yield event("sources", sources=sources)
             
-            STUDENT QUESTION: {query}
-            """
+            answer_parts = []
+            async for chunk in response_stream:
+                answer_parts.append(chunk.delta or "")
+                yield event("token", text=chunk.delta or "")
             
-            # Use stream_complete with fallback
-            response_stream, provider = self._call_with_fallback(prompt, stream=True)
-            logger.info(f"✅ Streaming from {provider}")
-            for chunk in response_stream:
-                yield chunk.delta
+            answer = "".join(answer_parts)
+            if not history:
+                await self.response_cache.astore(query_embedding, scope, answer, sources)
+            yield event("usage", prompt_tokens=prompt_tokens, completion_tokens=self.context_builder.counter.count(answer),
+                        first_token_ms=first_token_ms, total_ms=round((time.perf_counter() - started) * 1000))
+            yield event("done")
                 
         except Exception as e:
             logger.error(f"❌ BRAIN STREAM ERROR: {str(e)}")
-            yield f"Error: {str(e)}"
+            yield event("error", message=str(e))
+            yield event("done")
+
+    async def stream_ask(self, query, category="all", history=None, subject=None, year=None, ef_search=None, probes=None):
+        """Plain-text stream: token text only, errors inline as 'Error: ...'."""
+        async for item in self.stream_events(query, category, history, subject=subject, year=year,
+                                             ef_search=ef_search, probes=probes):
+            text = encode_text(item)
+            if text:
+                yield text
@@ -0,0 +1,198 @@
+"""
+Context Builder
+Packs retrieved chunks and conversation history into token budgets before
+they reach the prompt. Near-duplicate chunks are dropped, older turns are
+truncated first, and the size of every prompt is logged against what the
+unbounded assembly would have sent.
+"""
+
+import re
+import logging
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from app.core.config import Config
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Tokenizer per provider. Llama 3 uses a 128k BPE vocabulary that counts close
+# to cl100k; Gemini's tokenizer is not public, so it is estimated from characters.
+PROVIDER_ENCODINGS = {
+    "Gemini 2.0 Flash": None,
+    "Groq Llama 3.3 70B": "cl100k_base",
+    "Cerebras Llama 3.3 70B": "cl100k_base",
+}
+CHARS_PER_TOKEN = 4
+SHINGLE_SIZE = 5
+ELLIPSIS = "…"
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=None)
+def _encoding(name: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:  # encoding files are fetched on first use
+        logger.warning(f"⚠️ Tokenizer {name} unavailable, estimating from characters: {e}")
+        return None
+
+
+class TokenCounter:
+    """Counts tokens with every configured provider's tokenizer and keeps the largest, so a budget holds for any fallback."""
+
+    def __init__(self, providers: Optional[List[str]] = None):
+        names = {PROVIDER_ENCODINGS.get(p) for p in providers or PROVIDER_ENCODINGS}
+        self.encodings = [enc for enc in (_encoding(n) for n in names if n) if enc is not None]
+        self.estimate_chars = None in names or not self.encodings
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        counts = [len(enc.encode(text, disallowed_special=())) for enc in self.encodings]
+        if self.estimate_chars:
+            counts.append(-(-len(text) // CHARS_PER_TOKEN))
+        return max(counts)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of `text` (cut at a word boundary, plus an ellipsis) that fits in `max_tokens`."""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        cut = min(len(text), max_tokens * CHARS_PER_TOKEN)
+        while cut > 0:
+            head = text[:cut].rsplit(" ", 1)[0] if " " in text[:cut] else text[:cut]
+            candidate = head.rstrip() + ELLIPSIS
+            if self.count(candidate) <= max_tokens:
+                return candidate
+            cut = int(cut * 0.9)
+        return ""
+
+
+def shingles(text: str) -> set:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+@dataclass
+class PackedHistory:
+    text: str = ""
+    tokens: int = 0
+    raw_tokens: int = 0
+    turns: int = 0
+    truncated: int = 0
+
+
+@dataclass
+class PackedChunks:
+    text: str = ""
+    results: List = field(default_factory=list)
+    tokens: int = 0
+    raw_tokens: int = 0
+    duplicates: int = 0
+    over_budget: int = 0
+
+
+class ContextBuilder:
+    def __init__(self, counter: TokenCounter, context_budget: Optional[int] = None,
+                 history_budget: Optional[int] = None, max_turns: Optional[int] = None,
+                 dedup_threshold: Optional[float] = None):
+        self.counter = counter
+        self.context_budget = context_budget or Config.CONTEXT_TOKEN_BUDGET
+        self.history_budget = history_budget or Config.HISTORY_TOKEN_BUDGET
+        self.max_turns = max_turns or Config.HISTORY_MAX_TURNS
+        self.dedup_threshold = dedup_threshold or Config.CONTEXT_DEDUP_THRESHOLD
+
+    def pack_history(self, history: Optional[List[Dict]]) -> PackedHistory:
+        """Newest turns first; a turn that no longer fits is truncated and everything older is dropped."""
+        packed = PackedHistory()
+        if not history:
+            return packed
+        lines = []
+        for h in history[-self.max_turns:]:
+            role = "STUDENT" if h.get('role') == 'user' else "SPIRIT"
+            lines.append(f"{role}: {h.get('content')}\n")
+        packed.raw_tokens = sum(self.counter.count(line) for line in lines)
+
+        kept = []
+        remaining = self.history_budget
+        for line in reversed(lines):
+            tokens = self.counter.count(line)
+            if tokens > remaining:
+                line = self.counter.truncate(line.rstrip("\n"), remaining - 1)
+                if not line:
+                    break
+                line += "\n"
+                tokens = self.counter.count(line)
+                packed.truncated += 1
+            kept.append(line)
+            remaining -= tokens
+            if remaining <= 0:
+                break
+        packed.text = "".join(reversed(kept))
+        packed.tokens = self.history_budget - remaining
+        packed.turns = len(kept)
+        return packed
+
+    def pack_chunks(self, results: List) -> PackedChunks:
+        """
+        Chunks in rank order until the budget is spent. A chunk whose word
+        shingles overlap an already kept chunk by `dedup_threshold` or more is
+        skipped; the top chunk is truncated rather than dropped if it alone is too big.
+        """
+        packed = PackedChunks()
+        seen = []
+        parts = []
+        for r in results:
+            block = f"SOURCE: {r.content}\n---\n"
+            tokens = self.counter.count(block)
+            packed.raw_tokens += tokens
+
+            signature = shingles(r.content)
+            if any(jaccard(signature, other) >= self.dedup_threshold for other in seen):
+                packed.duplicates += 1
+                continue
+
+            if packed.tokens + tokens > self.context_budget:
+                if parts:
+                    packed.over_budget += 1
+                    continue  # a shorter, lower-ranked chunk may still fit
+                content = self.counter.truncate(r.content, self.context_budget - self.counter.count("SOURCE: \n---\n"))
+                block = f"SOURCE: {content}\n---\n"
+                tokens = self.counter.count(block)
+
+            seen.append(signature)
+            parts.append(block)
+            packed.results.append(r)
+            packed.tokens += tokens
+        packed.text = "".join(parts)
+        return packed
+
+    def report(self, prompt: str, history: PackedHistory, chunks: PackedChunks) -> int:
+        """Log the prompt size actually sent next to the unpacked size; returns the prompt token count."""
+        prompt_tokens = self.counter.count(prompt)
+        saved = (history.raw_tokens - history.tokens) + (chunks.raw_tokens - chunks.tokens)
+        logger.info(
+            f"🧮 Prompt {prompt_tokens} tokens "
+            f"(context {chunks.tokens}/{self.context_budget}, history {history.tokens}/{self.history_budget}, "
+            f"saved {max(saved, 0)}; dropped {chunks.duplicates} duplicate + {chunks.over_budget} over-budget chunks, "
+            f"truncated {history.truncated} turns)"
+        )
+        return prompt_tokens
@@ -0,0 +1,300 @@
+"""
+Embedding Cache
+Two-tier cache for text embeddings: an in-process LRU with size and TTL
+limits in front of a persistent SQLite store that honours the same TTL
+(expired rows are skipped on read and pruned). Entries are keyed by model
+name + sha256 of the text, so every service sharing a model shares hits.
+"""
+
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    PRUNE_INTERVAL_SECONDS = 3600
+
+    def __init__(self, model_name: str, path: Optional[str] = None,
+                 max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.model_name = model_name
+        self.max_entries = max_entries or Config.EMBED_CACHE_SIZE
+        self.ttl_seconds = Config.EMBED_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, embedding)
+        self._lock = threading.Lock()  # LRU tier and counters
+        self._db_lock = threading.Lock()  # SQLite tier, held off the event loop on the async path
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.coalesced = 0  # misses served by another caller's in-flight provider call
+        self.inflight: Dict[str, tuple] = {}  # key -> (provider call task, position in its batch), see CachedEmbedding
+
+        path = Config.EMBED_CACHE_PATH if path is None else path
+        self._db = None
+        self._pruned_at = 0.0
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("""
+                    CREATE TABLE IF NOT EXISTS embeddings (
+                        key TEXT PRIMARY KEY,
+                        model TEXT NOT NULL,
+                        vector BLOB NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                """)
+                self._db.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_created_at ON embeddings (created_at)")
+                self._db.commit()
+                self._prune()
+            except Exception as e:
+                logger.warning(f"⚠️ Persistent embedding cache disabled ({path}): {e}")
+                self._db = None
+
+    def _prune(self):
+        """Drop SQLite rows past the TTL (on open, then at most every PRUNE_INTERVAL_SECONDS of writes)."""
+        try:
+            with self._db_lock:
+                deleted = self._db.execute(
+                    "DELETE FROM embeddings WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+                ).rowcount
+                self._db.commit()
+            self._pruned_at = time.time()
+            if deleted:
+                logger.info(f"🧹 Pruned {deleted} expired embeddings from the persistent cache")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not prune embedding cache: {e}")
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, embedding: List[float]):
+        """Insert into the LRU tier, evicting the least recently used entries."""
+        self._memory[key] = (time.monotonic() + self.ttl_seconds, embedding)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _get_memory(self, texts: List[str]) -> Tuple[Dict[int, List[float]], Dict[str, List[int]]]:
+        """LRU tier lookup: ({index: embedding} found, {key: [indices]} still missing)."""
+        found: Dict[int, List[float]] = {}
+        missing: Dict[str, List[int]] = {}
+        now = time.monotonic()
+        with self._lock:
+            for idx, text in enumerate(texts):
+                key = self.key(text)
+                entry = self._memory.get(key)
+                if entry and entry[0] > now:
+                    self._memory.move_to_end(key)
+                    found[idx] = entry[1]
+                    self.hits_memory += 1
+                else:
+                    if entry:
+                        del self._memory[key]
+                    missing.setdefault(key, []).append(idx)
+        return found, missing
+
+    def _get_disk(self, missing: Dict[str, List[int]], found: Dict[int, List[float]]):
+        """SQLite tier lookup for the LRU misses; fills `found` and counts what is still missing."""
+        if missing and self._db is not None:
+            keys = list(missing)
+            rows = []
+            with self._db_lock:
+                for i in range(0, len(keys), 500):
+                    part = keys[i:i + 500]
+                    rows += self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))}) "
+                        f"AND created_at >= ?", part + [time.time() - self.ttl_seconds]
+                    ).fetchall()
+            with self._lock:
+                for key, blob in rows:
+                    embedding = array("f", blob).tolist()
+                    self._remember(key, embedding)
+                    for idx in missing.pop(key):
+                        found[idx] = embedding
+                        self.hits_disk += 1
+        with self._lock:
+            self.misses += sum(len(v) for v in missing.values())
+        return found
+
+    def get_many(self, texts: List[str]) -> Dict[int, List[float]]:
+        """Return {index: embedding} for every text found in either tier."""
+        found, missing = self._get_memory(texts)
+        return self._get_disk(missing, found)
+
+    async def aget_many(self, texts: List[str]) -> Dict[int, List[float]]:
+        """get_many() for the event loop: the LRU lookup runs inline, the SQLite tier in a thread."""
+        found, missing = self._get_memory(texts)
+        if missing and self._db is not None:
+            return await asyncio.to_thread(self._get_disk, missing, found)
+        return self._get_disk(missing, found)
+
+    def _put_memory(self, texts: List[str], embeddings: List[List[float]]) -> List[tuple]:
+        """Insert into the LRU tier; returns the rows to persist."""
+        rows = []
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                key = self.key(text)
+                self._remember(key, embedding)
+                rows.append((key, self.model_name, array("f", embedding).tobytes(), time.time()))
+        return rows
+
+    def _put_disk(self, rows: List[tuple]):
+        if self._db is None or not rows:
+            return
+        with self._db_lock:
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+                self._db.commit()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not persist embeddings: {e}")
+        if time.time() - self._pruned_at > self.PRUNE_INTERVAL_SECONDS:
+            self._prune()
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]):
+        self._put_disk(self._put_memory(texts, embeddings))
+
+    async def aput_many(self, texts: List[str], embeddings: List[List[float]]):
+        """put_many() for the event loop: the LRU insert runs inline, the SQLite write in a thread."""
+        rows = self._put_memory(texts, embeddings)
+        if self._db is not None and rows:
+            await asyncio.to_thread(self._put_disk, rows)
+
+    def stats(self) -> Dict:
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "model": self.model_name,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": round((self.hits_memory + self.hits_disk) / lookups, 4) if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "memory_entries": len(self._memory),
+            "persistent": self._db is not None,
+        }
+
+
+class CachedEmbedding:
+    """
+    Drop-in wrapper around a llama_index embedding model that consults the
+    cache before calling the provider. Unknown attributes fall through to the model.
+    """
+
+    def __init__(self, embed_model, cache: Optional[EmbeddingCache] = None):
+        self.embed_model = embed_model
+        self.cache = cache or get_embedding_cache(embed_model.model_name)
+
+    def __getattr__(self, name):
+        return getattr(self.embed_model, name)
+
+    def get_text_embedding(self, text: str) -> List[float]:
+        return self.get_text_embedding_batch([text])[0]
+
+    def get_text_embedding_batch(self, texts: List[str], **kwargs) -> List[List[float]]:
+        found = self.cache.get_many(texts)
+        missing = [i for i in range(len(texts)) if i not in found]
+        if missing:
+            from app.services.embeddings import embed_text_batch  # keeps numpy out of main's import
+            fresh = embed_text_batch(self.embed_model, [texts[i] for i in missing], **kwargs)
+            self.cache.put_many([texts[i] for i in missing], fresh)
+            found.update(zip(missing, fresh))
+        return [found[i] for i in range(len(texts))]
+
+    async def aget_text_embedding(self, text: str) -> List[float]:
+        return (await self.aget_text_embedding_batch([text]))[0]
+
+    async def aget_text_embedding_batch(self, texts: List[str], **kwargs) -> List[List[float]]:
+        """
+        Cache misses already being embedded for another caller (same text, same
+        event loop) are awaited from that call instead of being requested again.
+        """
+        found = await self.cache.aget_many(texts)
+        missing = [i for i in range(len(texts)) if i not in found]
+        if not missing:
+            return [found[i] for i in range(len(texts))]
+
+        loop = asyncio.get_running_loop()
+        inflight = self.cache.inflight
+        waits = {}  # idx -> (task or None for ours, position in that task's batch)
+        new_keys: Dict[str, int] = {}  # key -> position in our provider call
+        new_texts: List[str] = []
+        for i in missing:
+            key = self.cache.key(texts[i])
+            entry = inflight.get(key)
+            if entry is not None and entry[0].get_loop() is loop:
+                waits[i] = entry
+                self.cache.coalesced += 1
+            else:
+                if key not in new_keys:
+                    new_keys[key] = len(new_texts)
+                    new_texts.append(texts[i])
+                waits[i] = (None, new_keys[key])
+
+        if new_keys:
+            task = asyncio.ensure_future(self._fetch(new_texts, kwargs))
+            for key, pos in new_keys.items():
+                inflight[key] = (task, pos)
+            task.add_done_callback(lambda _: self._forget(new_keys, task))
+        for i, (other, pos) in waits.items():
+            found[i] = (await asyncio.shield(other or task))[pos]
+        return [found[i] for i in range(len(texts))]
+
+    async def aembed_many(self, texts: List[str], pipeline=None) -> Tuple[List[List[float]], int]:
+        """
+        Embeddings for a large list, in input order, plus how many came from
+        the cache. Hits are resolved per item first; only the distinct misses
+        go to the provider, in full-size batches run concurrently by `pipeline`
+        (an EmbeddingPipeline over the wrapped model, so they are not looked up
+        again), and are stored with one put.
+        """
+        found = await self.cache.aget_many(texts)
+        cached = len(found)
+        misses = list(dict.fromkeys(texts[i] for i in range(len(texts)) if i not in found))
+        if misses:
+            from app.services.embeddings import EmbeddingPipeline  # keeps numpy out of main's import
+            vectors = await (pipeline or EmbeddingPipeline(self.embed_model)).aembed(misses)
+            await self.cache.aput_many(misses, vectors)
+            fresh = dict(zip(misses, vectors))
+            for i, text in enumerate(texts):
+                if i not in found:
+                    found[i] = fresh[text]
+        return [found[i] for i in range(len(texts))], cached
+
+    async def _fetch(self, texts: List[str], kwargs) -> List[List[float]]:
+        fresh = await self.embed_model.aget_text_embedding_batch(texts, **kwargs)
+        await self.cache.aput_many(texts, fresh)
+        return fresh
+
+    def _forget(self, keys: Dict[str, int], task: asyncio.Task):
+        if not task.cancelled():
+            task.exception()  # retrieved here: callers may all have gone
+        for key in keys:
+            if self.cache.inflight.get(key, (None,))[0] is task:
+                del self.cache.inflight[key]
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str) -> EmbeddingCache:
+    """Process-wide cache per embedding model, shared by chat, ingestion and /embeddings."""
+    with _caches_lock:
+        if model_name not in _caches:
+            _caches[model_name] = EmbeddingCache(model_name)
+        return _caches[model_name]
+
+
+def embedding_cache_stats() -> List[Dict]:
+    return [cache.stats() for cache in _caches.values()]
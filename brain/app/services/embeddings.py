@@ -0,0 +1,205 @@
+"""
+Embedding Pipeline
+Sends chunk texts to the embedding model in batches, keeps a bounded number
+of batches in flight and retries rate-limited batches with backoff. Also
+packs embeddings as float32 matrices for the batch /embeddings/batch endpoint.
+"""
+
+import io
+import time
+import base64
+import asyncio
+import random
+import logging
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def is_rate_limit_error(error) -> bool:
+    """Check if an error is a rate limit/quota error."""
+    error_str = str(error).lower()
+    return any(x in error_str for x in ["429", "quota", "rate", "limit", "exceeded", "resource_exhausted"])
+
+
+def embed_text_batch(embed_model, texts: List[str], **kwargs) -> List[List[float]]:
+    """
+    Embeddings for `texts` in one provider request where the model allows it.
+    llama_index's sync GeminiEmbedding sends one embed_content call per text;
+    the genai client takes the whole list (batchEmbedContents), as the async
+    path already does.
+    """
+    try:
+        from llama_index.embeddings.gemini import GeminiEmbedding
+    except ImportError:
+        GeminiEmbedding = None
+    if GeminiEmbedding is not None and isinstance(embed_model, GeminiEmbedding) and texts:
+        return embed_model._model.embed_content(
+            model=embed_model.model_name,
+            content=list(texts),
+            title=embed_model.title,
+            task_type=embed_model.task_type,
+            request_options=embed_model._request_options,
+        )["embedding"]
+    return embed_model.get_text_embedding_batch(texts, **kwargs)
+
+
+@dataclass
+class EmbeddingStats:
+    chunks: int = 0
+    batches: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds > 0 else 0.0
+
+
+class EmbeddingPipeline:
+    """Batched, bounded-concurrency wrapper around a llama_index embedding model."""
+
+    def __init__(self, embed_model, batch_size: Optional[int] = None, max_in_flight: Optional[int] = None,
+                 max_retries: Optional[int] = None, backoff_seconds: Optional[float] = None):
+        self.embed_model = embed_model
+        self.batch_size = batch_size or Config.EMBED_BATCH_SIZE
+        self.max_in_flight = max_in_flight or Config.EMBED_MAX_IN_FLIGHT
+        self.max_retries = Config.EMBED_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_seconds = Config.EMBED_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+        self.last_stats = EmbeddingStats()
+
+    def _embed_batch(self, batch: List[str]) -> Tuple[List[List[float]], int]:
+        """Embed one batch (one provider request), retrying it with exponential backoff on rate limits."""
+        attempt = 0
+        while True:
+            try:
+                return embed_text_batch(self.embed_model, batch), attempt
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random() * 0.25)
+                attempt += 1
+                logger.warning(f"⚠️ Embedding batch rate limited, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def embed_batches(self, texts: List[str]) -> Iterator[Tuple[int, List[List[float]]]]:
+        """
+        Yield (start_index, embeddings) per batch as batches complete.
+        At most `max_in_flight` batches are outstanding at any time.
+        """
+        stats = EmbeddingStats()
+        self.last_stats = stats
+        started = time.perf_counter()
+        starts = iter(range(0, len(texts), self.batch_size))
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            in_flight = {}
+
+            def submit_next() -> bool:
+                start = next(starts, None)
+                if start is None:
+                    return False
+                batch = texts[start:start + self.batch_size]
+                in_flight[executor.submit(self._embed_batch, batch)] = start
+                return True
+
+            for _ in range(self.max_in_flight):
+                if not submit_next():
+                    break
+
+            try:
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        start = in_flight.pop(future)
+                        embeddings, retries = future.result()
+                        stats.chunks += len(embeddings)
+                        stats.batches += 1
+                        stats.retries += retries
+                        stats.seconds = time.perf_counter() - started
+                        yield start, embeddings
+                        submit_next()
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+        stats.seconds = time.perf_counter() - started
+        logger.info(
+            f"📈 Embedded {stats.chunks} chunks in {stats.batches} batches "
+            f"({stats.chunks_per_sec:.1f} chunks/sec, {stats.retries} retries)"
+        )
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed all texts, returning embeddings in input order."""
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        for start, embeddings in self.embed_batches(texts):
+            results[start:start + len(embeddings)] = embeddings
+        return results
+
+    async def _aembed_batch(self, batch: List[str], semaphore: asyncio.Semaphore, stats: EmbeddingStats) -> List[List[float]]:
+        async with semaphore:
+            attempt = 0
+            while True:
+                try:
+                    embeddings = await self.embed_model.aget_text_embedding_batch(batch)
+                    stats.batches += 1
+                    stats.retries += attempt
+                    return embeddings
+                except Exception as e:
+                    if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                        raise
+                    delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random() * 0.25)
+                    attempt += 1
+                    logger.warning(f"⚠️ Embedding batch rate limited, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """Async embed() for request handlers: batches run concurrently (at most max_in_flight), input order kept."""
+        stats = EmbeddingStats(chunks=len(texts))
+        self.last_stats = stats
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        batches = await asyncio.gather(*(
+            self._aembed_batch(texts[start:start + self.batch_size], semaphore, stats)
+            for start in range(0, len(texts), self.batch_size)
+        ))
+        stats.seconds = time.perf_counter() - started
+        return [embedding for batch in batches for embedding in batch]
+
+
+# /embeddings/batch output formats: float32, little-endian, row-major (count x dimensions)
+EMBEDDING_FORMATS = {
+    "json": "application/json",
+    "base64": "application/json",
+    "binary": "application/octet-stream",
+    "npy": "application/x-npy",
+}
+EMBEDDING_DTYPE = "<f4"
+
+
+def to_matrix(embeddings: List[List[float]]) -> np.ndarray:
+    dimensions = len(embeddings[0]) if embeddings else 0
+    return np.asarray(embeddings, dtype=EMBEDDING_DTYPE).reshape(len(embeddings), dimensions)
+
+
+def encode_matrix(matrix: np.ndarray, fmt: str) -> bytes:
+    """Raw bytes for the binary formats: `binary` is the bare buffer, `npy` a NumPy .npy file (np.load-able)."""
+    if fmt == "npy":
+        buffer = io.BytesIO()
+        np.save(buffer, matrix, allow_pickle=False)
+        return buffer.getvalue()
+    return matrix.tobytes()
+
+
+def embeddings_payload(embeddings: List[List[float]], fmt: str) -> Dict:
+    """`json`: float lists as returned by the model; `base64`: the whole matrix as one string (np.frombuffer + reshape)."""
+    if fmt == "base64":
+        matrix = to_matrix(embeddings)
+        return {"dtype": EMBEDDING_DTYPE, "shape": list(matrix.shape), "data": base64.b64encode(matrix.tobytes()).decode("ascii")}
+    return {"embeddings": embeddings}
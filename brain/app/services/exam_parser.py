@@ -0,0 +1,334 @@
+"""
+Exam Parser
+Single-pass, line-oriented parser for IIT Madras BS exam papers, shared by
+scripts/parse_exam.py and the exam upload service. Pages are consumed as a
+stream of text and each Question is emitted as soon as its block ends, so
+memory stays flat for large multi-paper dumps.
+"""
+
+import re
+from bisect import bisect_right
+from dataclasses import dataclass, asdict
+from enum import Enum
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+class QuestionType(str, Enum):
+    MCQ = "MCQ"
+    MSQ = "MSQ"
+    SA = "SA"
+    COMPREHENSION = "COMPREHENSION"
+
+
+@dataclass
+class Option:
+    id: str
+    text: str
+    is_correct: bool = False
+
+
+@dataclass
+class Question:
+    question_number: int
+    question_id: str
+    question_type: QuestionType
+    question_text: str
+    marks: float
+    options: List[Option]
+    correct_answer: Any  # Can be option ID, list of IDs, or numeric value
+    section: str = ""
+    is_comprehension_sub: bool = False
+    parent_comprehension_id: Optional[str] = None
+    page: Optional[int] = None   # where the question block starts in the PDF (0-based page, y from top)
+    top: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        """Plain dict; page/top are left out for questions parsed without positions (plain text)."""
+        data = asdict(self)
+        data["question_type"] = self.question_type.value
+        for name in ("page", "top"):
+            if data[name] is None:
+                del data[name]
+        return data
+
+
+@dataclass
+class ExamPaper:
+    name: str
+    subject: str
+    term: str
+    duration_minutes: int
+    total_marks: float
+    sections: List[str]
+    questions: List[Question]
+
+
+METADATA_PATTERNS = {
+    "paper_name": re.compile(r"Question Paper Name\s*:\s*(.+)", re.IGNORECASE),
+    "subject_name": re.compile(r"Subject Name\s*:\s*(.+)", re.IGNORECASE),
+    "duration": re.compile(r"Duration\s*:\s*(\d+)", re.IGNORECASE),
+    "total_marks": re.compile(r"Total Marks\s*:\s*(\d+)", re.IGNORECASE),
+}
+QUESTION_START = re.compile(r"Question Number\s*:\s*(\d+)")
+QUESTION_ID = re.compile(r"Question Id\s*:\s*(\d+)")
+QUESTION_TYPE = re.compile(r"Question Type\s*:\s*(MCQ|MSQ|SA|COMPREHENSION)")
+CORRECT_MARKS = re.compile(r"Correct Marks\s*:\s*(\d+\.?\d*)")
+QUESTION_LABEL = re.compile(r"Question Label\s*:")
+OPTIONS_START = re.compile(r"Options\s*:\s*(.*)", re.IGNORECASE)
+ANSWERS_START = re.compile(r"Possible Answers\s*:\s*(.*)", re.IGNORECASE)
+RESPONSE_TYPE = re.compile(r"Response Type\s*:", re.IGNORECASE)
+OPTION_ID = re.compile(r"(\d{10,15})\.?\s*")
+CORRECT_MARKER = re.compile(r"\(correct\)|✓|✔", re.IGNORECASE)
+SECTION_HEADER = re.compile(r"(Sem\d+\s+\w+\d*)$|Section\s*:\s*(\w+)", re.IGNORECASE)
+SECTION_META = re.compile(r"(Sub-Section|Section (Id|Number|Marks))\b", re.IGNORECASE)
+YEAR = re.compile(r"20\d{2}")
+
+MONTHS = {
+    'jan': 'January', 'feb': 'February', 'mar': 'March',
+    'apr': 'April', 'may': 'May', 'jun': 'June',
+    'jul': 'July', 'aug': 'August', 'sep': 'September',
+    'oct': 'October', 'nov': 'November', 'dec': 'December'
+}
+
+# Parser states
+HEADER = "header"      # between questions: metadata, section headers
+PREAMBLE = "preamble"  # inside a question, before its label
+TEXT = "text"          # question body
+OPTIONS = "options"
+RESPONSE = "response"  # between Response Type and Possible Answers
+ANSWERS = "answers"
+
+
+def extract_term(paper_name: str) -> str:
+    """Extract term from paper name (e.g., 'Aug 2025' -> 'August 2025')."""
+    for abbr, full in MONTHS.items():
+        if abbr in paper_name.lower():
+            year_match = YEAR.search(paper_name)
+            year = year_match.group() if year_match else "2025"
+            return f"{full} {year}"
+    return "Unknown Term"
+
+
+def _collapse(parts: List[str]) -> str:
+    return " ".join(" ".join(parts).split())
+
+
+class ExamParser:
+    """
+    Line-driven state machine. Feed lines with feed_line() (or whole pages
+    with iter_questions()); a Question is returned when the next question
+    starts, and finish() returns the last one.
+    """
+
+    def __init__(self):
+        self.metadata: Dict[str, Optional[str]] = {name: None for name in METADATA_PATTERNS}
+        self.sections: List[str] = []
+        self.current_section = ""
+        self._state = HEADER
+        self._current: Optional[Dict] = None
+
+    def _start(self, number: int, line: str, page: Optional[int], top: Optional[float]):
+        qid = QUESTION_ID.search(line)
+        qtype = QUESTION_TYPE.search(line)
+        self._current = {
+            "number": number,
+            "page": page,
+            "top": top,
+            "id": qid.group(1) if qid else None,
+            "type": qtype.group(1) if qtype else None,
+            "marks": 0.0,
+            "text": [],
+            "options": [],  # [option_id, [text parts]]
+            "answer": None,
+        }
+        self._state = PREAMBLE
+        self._preamble(line)
+
+    def _preamble(self, line: str):
+        current = self._current
+        if current["id"] is None:
+            match = QUESTION_ID.search(line)
+            if match:
+                current["id"] = match.group(1)
+        if current["type"] is None:
+            match = QUESTION_TYPE.search(line)
+            if match:
+                current["type"] = match.group(1)
+        match = CORRECT_MARKS.search(line)
+        if match:
+            current["marks"] = float(match.group(1))
+        if QUESTION_LABEL.search(line):
+            self._state = TEXT
+
+    def _add_options(self, text: str):
+        """Split a line of the options area at option IDs; leading text continues the previous option."""
+        options = self._current["options"]
+        pos = 0
+        for match in OPTION_ID.finditer(text):
+            if options and match.start() > pos:
+                options[-1][1].append(text[pos:match.start()])
+            options.append([match.group(1), []])
+            pos = match.end()
+        if options and pos < len(text):
+            options[-1][1].append(text[pos:])
+
+    def _complete(self) -> Optional[Question]:
+        current, self._current = self._current, None
+        self._state = HEADER
+        if current is None or current["type"] is None:
+            return None
+        question_type = QuestionType(current["type"])
+
+        options = []
+        correct_answer = None
+        if question_type in (QuestionType.MCQ, QuestionType.MSQ):
+            for option_id, parts in current["options"]:
+                text = _collapse(parts)
+                is_correct = bool(CORRECT_MARKER.search(text))
+                if is_correct:
+                    text = _collapse([CORRECT_MARKER.sub("", text)])
+                options.append(Option(id=option_id, text=text[:500], is_correct=is_correct))
+            correct_answer = [o.id for o in options if o.is_correct] or None
+        elif question_type == QuestionType.SA:
+            correct_answer = current["answer"]
+
+        return Question(
+            question_number=current["number"],
+            question_id=current["id"] or f"q_{current['number']}",
+            question_type=question_type,
+            question_text=_collapse(current["text"]),
+            marks=current["marks"],
+            options=options,
+            correct_answer=correct_answer,
+            section=self.current_section,
+            page=current["page"],
+            top=current["top"],
+        )
+
+    def feed_line(self, line: str, page: Optional[int] = None, top: Optional[float] = None) -> Optional[Question]:
+        line = line.strip()
+        if not line:
+            return None
+
+        if "Question Number" in line:
+            match = QUESTION_START.search(line)
+            if match:
+                done = self._complete() if self._current else None
+                self._start(int(match.group(1)), line, page, top)
+                return done
+
+        done = None
+        if self._state in (OPTIONS, ANSWERS) and (SECTION_META.match(line) or SECTION_HEADER.match(line)):
+            # Section boundaries close the current option/answer list
+            done = self._complete()
+
+        state = self._state
+        if state == HEADER:
+            section = SECTION_HEADER.match(line)
+            if section:
+                self.current_section = section.group(1) or section.group(2)
+                if self.current_section not in self.sections:
+                    self.sections.append(self.current_section)
+            elif ":" in line and not SECTION_META.match(line):
+                for name, pattern in METADATA_PATTERNS.items():
+                    if self.metadata[name] is None:
+                        match = pattern.search(line)
+                        if match:
+                            self.metadata[name] = match.group(1).strip()
+            return done
+        if state == PREAMBLE:
+            self._preamble(line)
+            return None
+
+        if state in (TEXT, OPTIONS, RESPONSE):
+            match = OPTIONS_START.match(line)
+            if match:
+                self._state = OPTIONS
+                self._add_options(match.group(1))
+                return None
+            match = ANSWERS_START.match(line)
+            if match:
+                self._state = ANSWERS
+                if match.group(1):
+                    self._current["answer"] = match.group(1).strip()
+                return None
+            if RESPONSE_TYPE.match(line):
+                self._state = RESPONSE
+                return None
+
+        if state == TEXT:
+            self._current["text"].append(line)
+        elif state == OPTIONS:
+            self._add_options(line)
+        elif state == ANSWERS and self._current["answer"] is None:
+            self._current["answer"] = line
+        return None
+
+    def finish(self) -> Optional[Question]:
+        return self._complete() if self._current else None
+
+    def paper(self, questions: List[Question], default_duration: int = 120, default_marks: float = 50) -> ExamPaper:
+        name = self.metadata["paper_name"] or "Unknown Paper"
+        return ExamPaper(
+            name=name,
+            subject=self.metadata["subject_name"] or "Unknown Subject",
+            term=extract_term(name),
+            duration_minutes=int(self.metadata["duration"] or default_duration),
+            total_marks=float(self.metadata["total_marks"] or default_marks),
+            sections=list(self.sections),
+            questions=questions,
+        )
+
+
+def iter_questions(pages: Iterable[str], parser: Optional[ExamParser] = None) -> Iterator[Question]:
+    """Questions from a stream of page (or line) texts, yielded as each block completes."""
+    parser = parser or ExamParser()
+    for page in pages:
+        for line in page.splitlines():
+            question = parser.feed_line(line)
+            if question:
+                yield question
+    question = parser.finish()
+    if question:
+        yield question
+
+
+def iter_positioned_questions(pages: Iterable, parser: Optional[ExamParser] = None) -> Iterator[Question]:
+    """Like iter_questions() for pages with positioned lines (pdf_pages.PageContent); questions get page and top."""
+    parser = parser or ExamParser()
+    for page in pages:
+        for line, top in page.lines:
+            question = parser.feed_line(line, page.page_num, top)
+            if question:
+                yield question
+    question = parser.finish()
+    if question:
+        yield question
+
+
+class QuestionLocator:
+    """
+    Maps a point on a page to the question block containing it. Question
+    starts are kept sorted by (page, top); a lookup is one bisect, and a point
+    above the first question of its page falls to the last question of an
+    earlier page (a block continuing across a page break).
+    """
+
+    def __init__(self, questions: List):
+        positioned = sorted(
+            (q["page"], q["top"], idx) for idx, q in enumerate(questions)
+            if q.get("page") is not None and q.get("top") is not None
+        )
+        self._keys = [(page, top) for page, top, _ in positioned]
+        self._indices = [idx for _, _, idx in positioned]
+
+    def locate(self, page: int, top: float) -> Optional[int]:
+        """Index (into the questions list) of the question containing (page, top), or None before the first question."""
+        pos = bisect_right(self._keys, (page, top)) - 1
+        return self._indices[pos] if pos >= 0 else None
+
+
+def parse_exam(pages: Iterable[str], default_duration: int = 120, default_marks: float = 50) -> ExamPaper:
+    parser = ExamParser()
+    questions = list(iter_questions(pages, parser))
+    return parser.paper(questions, default_duration, default_marks)
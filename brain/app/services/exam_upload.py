@@ -3,231 +3,147 @@ Exam Upload Service
 Handles PDF upload, parsing, image extraction, and database insertion.
 """
 
-import os
-import io
+import time
 import uuid
-import base64
-import tempfile
-from typing import List, Dict, Optional, Any
-from dataclasses import dataclass, asdict
-import json
+import asyncio
+import hashlib
+import logging
+from typing import List, Dict, Optional
 
-import pdfplumber
-from imagekitio import ImageKit
-import psycopg2
-from psycopg2.extras import RealDictCursor, Json
+from psycopg2.extras import RealDictCursor, Json, execute_values
 
-from app.core.config import Config
+from app.core import database
+from app.services.pdf_pages import parse_pages
+from app.services.exam_parser import ExamParser, QuestionLocator, iter_questions, iter_positioned_questions
+from app.services.image_upload import get_image_pipeline
 
-
-# Initialize ImageKit
-# SDK v5 auto-reads from env vars: IMAGEKIT_PRIVATE_KEY
-imagekit = None
-if Config.IMAGEKIT_PRIVATE_KEY:
-    try:
-        imagekit = ImageKit(private_key=Config.IMAGEKIT_PRIVATE_KEY)
-        print("✅ ImageKit initialized successfully")
-    except Exception as e:
-        print(f"⚠️ ImageKit initialization failed: {e}")
-        imagekit = None
-else:
-    print("⚠️ ImageKit not configured - images will not be uploaded")
+logger = logging.getLogger(__name__)
 
 
 def get_db_connection():
-    """Get PostgreSQL connection."""
-    if Config.DATABASE_URL:
-        return psycopg2.connect(Config.DATABASE_URL)
-    return psycopg2.connect(
-        host=Config.DB_HOST,
-        database=Config.DB_NAME,
-        user=Config.DB_USER,
-        password=Config.DB_PASS,
-        port=Config.DB_PORT
-    )
+    """Get a PostgreSQL connection from the shared pool (close() returns it to the pool)."""
+    return database.get_db_connection()
 
 
-def upload_image_to_imagekit(image_bytes: bytes, filename: str) -> Optional[str]:
-    """Upload image to ImageKit and return URL."""
-    if not imagekit:
-        print("ImageKit not configured, skipping image upload")
-        return None
+def parse_pdf_with_images(pdf_bytes: bytes) -> Dict:
+    """Parse PDF and extract questions with images (pages parsed in parallel, see pdf_pages)."""
+    pages = parse_pages(pdf_bytes)
     
-    try:
-        # Convert bytes to base64
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-        
-        # SDK v5 uses ik.files.upload()
-        result = imagekit.files.upload(
-            file=f"data:image/png;base64,{image_base64}",
-            file_name=filename,
-            folder="/exam_questions/",
-            use_unique_file_name=True
-        )
-        
-        if result and hasattr(result, 'url') and result.url:
-            print(f"✅ Uploaded image: {result.url}")
-            return result.url
-    except Exception as e:
-        print(f"⚠️ Failed to upload image: {e}")
+    # Single pass over the positioned page lines: metadata and questions together,
+    # each question tagged with the page and y-coordinate where its block starts
+    parser = ExamParser()
+    questions = [q.to_dict() for q in iter_positioned_questions(pages, parser)]
+    paper = parser.paper(questions, default_duration=60, default_marks=50)
     
-    return None
+    return {
+        "name": paper.name,
+        "subject": paper.subject,
+        "duration_minutes": paper.duration_minutes,
+        "total_marks": paper.total_marks,
+        "questions": questions,
+        "images": [img for page in pages for img in page.images],
+        "page_count": len(pages)
+    }
 
 
-def extract_images_from_page(page, page_num: int) -> List[Dict]:
-    """Extract images from a PDF page."""
-    images = []
-    
-    try:
-        page_images = page.images
-        for idx, img in enumerate(page_images):
-            # Get image data
-            image_bytes = img.get("stream", None)
-            if image_bytes:
-                # Try to extract raw image data
-                try:
-                    raw_data = image_bytes.get_data()
-                    filename = f"page_{page_num}_img_{idx}.png"
-                    images.append({
-                        "data": raw_data,
-                        "filename": filename,
-                        "bbox": (img["x0"], img["top"], img["x1"], img["bottom"])
-                    })
-                except:
-                    pass
-    except Exception as e:
-        print(f"Error extracting images from page {page_num}: {e}")
-    
-    return images
+DECORATIVE_SAME_PLACE_PAGES = 3  # same image at the same spot on this many pages (or all of them): a header/logo
 
 
-def parse_pdf_with_images(pdf_bytes: bytes) -> Dict:
-    """Parse PDF and extract questions with images."""
-    import re
-    
-    # Write to temp file for pdfplumber
-    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-        tmp.write(pdf_bytes)
-        tmp_path = tmp.name
-    
-    try:
-        full_text = ""
-        all_images = []
-        
-        with pdfplumber.open(tmp_path) as pdf:
-            for page_num, page in enumerate(pdf.pages):
-                # Extract text
-                page_text = page.extract_text()
-                if page_text:
-                    full_text += page_text + "\n"
-                
-                # Extract images
-                page_images = extract_images_from_page(page, page_num)
-                all_images.extend(page_images)
-        
-        # Parse metadata
-        paper_name = re.search(r"Question Paper Name\s*:\s*(.+)", full_text)
-        subject_name = re.search(r"Subject Name\s*:\s*(.+)", full_text)
-        duration = re.search(r"Duration\s*:\s*(\d+)", full_text)
-        total_marks = re.search(r"Total Marks\s*:\s*(\d+)", full_text)
-        
-        # Parse questions
-        questions = parse_questions_from_text(full_text)
-        
-        return {
-            "name": paper_name.group(1).strip() if paper_name else "Unknown Paper",
-            "subject": subject_name.group(1).strip() if subject_name else "Unknown Subject",
-            "duration_minutes": int(duration.group(1)) if duration else 60,
-            "total_marks": float(total_marks.group(1)) if total_marks else 50,
-            "questions": questions,
-            "images": all_images
-        }
-    finally:
-        os.unlink(tmp_path)
+def decorative_images(images: List[Dict], page_count: Optional[int] = None) -> set:
+    """
+    ids (id(img)) of images that are page furniture rather than question
+    content: the same bytes on most pages of the paper, or at the same
+    position on several pages. A diagram shared by two questions on
+    different pages is kept.
+    """
+    digests = {id(img): hashlib.sha256(img["data"]).hexdigest() for img in images}
+    pages_by_hash: Dict[str, set] = {}
+    pages_by_place: Dict[tuple, set] = {}
+    for img in images:
+        digest = digests[id(img)]
+        pages_by_hash.setdefault(digest, set()).add(img["page"])
+        place = (digest,) + tuple(round(v) for v in img["bbox"])
+        pages_by_place.setdefault(place, set()).add(img["page"])
+    page_count = page_count or len({img["page"] for img in images})
+
+    same_place_pages = max(2, min(DECORATIVE_SAME_PLACE_PAGES, page_count))
+    decorative = set()
+    for img in images:
+        digest = digests[id(img)]
+        place = (digest,) + tuple(round(v) for v in img["bbox"])
+        on_most_pages = len(pages_by_hash[digest]) > 2 and len(pages_by_hash[digest]) > page_count / 2
+        if on_most_pages or len(pages_by_place[place]) >= same_place_pages:
+            decorative.add(id(img))
+    return decorative
+
+
+def associate_images(questions: List[Dict], images: List[Dict], page_count: Optional[int] = None) -> Dict[int, Dict]:
+    """
+    Match images to the question block they sit in, by page and bbox top.
+    Decorative images (see decorative_images) are skipped; a question with
+    several images keeps the first in reading order. The image dicts are not
+    modified. Returns question index -> image.
+    """
+    decorative = decorative_images(images, page_count)
+    locator = QuestionLocator(questions)
+    assigned: Dict[int, Dict] = {}
+    for img in sorted(images, key=lambda img: (img["page"], img["bbox"][1])):
+        if id(img) in decorative:
+            continue
+        idx = locator.locate(img["page"], img["bbox"][1])
+        if idx is not None and idx not in assigned:
+            assigned[idx] = img
+    return assigned
 
 
 def parse_questions_from_text(text: str) -> List[Dict]:
     """Parse questions from extracted text."""
-    import re
-    
-    questions = []
-    
-    # Split by question boundaries
-    question_blocks = re.split(r'(?=Question Number\s*:\s*\d+)', text)
-    
-    for block in question_blocks:
-        if not block.strip():
-            continue
-        
-        # Extract question number
-        qnum_match = re.search(r"Question Number\s*:\s*(\d+)", block)
-        if not qnum_match:
-            continue
-        
-        question_number = int(qnum_match.group(1))
-        
-        # Extract question ID
-        qid_match = re.search(r"Question Id\s*:\s*(\d+)", block)
-        question_id = qid_match.group(1) if qid_match else f"q_{question_number}"
-        
-        # Extract question type
-        qtype_match = re.search(r"Question Type\s*:\s*(MCQ|MSQ|SA|COMPREHENSION)", block)
-        if not qtype_match:
+    return [q.to_dict() for q in iter_questions([text])]
+
+
+def pdf_content_hash(pdf_bytes: bytes) -> str:
+    """Identity of an uploaded paper: re-uploading the same PDF maps to the same term_papers row."""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def unique_questions(questions: List[Dict]) -> List[Dict]:
+    """Questions with a repeated question_id dropped (first one wins); the id is the upsert key."""
+    seen = set()
+    unique = []
+    for q in questions:
+        if q["question_id"] in seen:
+            logger.warning(f"⚠️ Duplicate question id {q['question_id']} (question {q['question_number']}) skipped")
             continue
-        question_type = qtype_match.group(1)
-        
-        # Extract marks
-        marks_match = re.search(r"Correct Marks\s*:\s*(\d+\.?\d*)", block)
-        marks = float(marks_match.group(1)) if marks_match else 0
-        
-        # Extract question text
-        label_match = re.search(r"Question Label\s*:\s*.+?\n(.+?)(?=Options|Possible Answers|Response Type|$)", block, re.DOTALL)
-        question_text = label_match.group(1).strip() if label_match else ""
-        question_text = re.sub(r'\s+', ' ', question_text)
-        
-        # Extract options for MCQ/MSQ
-        options = []
-        if question_type in ["MCQ", "MSQ"]:
-            options_match = re.search(r"Options\s*:(.+?)(?=Sub-Section|Question Number|Possible Answers|$)", block, re.DOTALL)
-            if options_match:
-                options_text = options_match.group(1)
-                option_pattern = r"(\d{10,15})\.?\s*(.+?)(?=\d{10,15}|$)"
-                for match in re.finditer(option_pattern, options_text, re.DOTALL):
-                    opt_id = match.group(1)
-                    opt_text = match.group(2).strip()
-                    opt_text = re.sub(r'\s+', ' ', opt_text)[:500]
-                    is_correct = "(correct)" in opt_text.lower() or "✓" in opt_text
-                    opt_text = opt_text.replace("(correct)", "").strip()
-                    options.append({
-                        "id": opt_id,
-                        "text": opt_text,
-                        "is_correct": is_correct
-                    })
-        
-        # Extract answer for SA
-        correct_answer = None
-        if question_type == "SA":
-            answer_match = re.search(r"Possible Answers\s*:\s*(.+?)(?=Sub-Section|Question Number|$)", block, re.DOTALL)
-            if answer_match:
-                correct_answer = answer_match.group(1).strip().split('\n')[0].strip()
-        elif options:
-            correct_answer = [opt["id"] for opt in options if opt.get("is_correct")]
-        
-        questions.append({
-            "question_number": question_number,
-            "question_id": question_id,
-            "question_type": question_type,
-            "question_text": question_text,
-            "marks": marks,
-            "options": options,
-            "correct_answer": correct_answer
-        })
-    
-    return questions
+        seen.add(q["question_id"])
+        unique.append(q)
+    return unique
+
+
+def find_paper_by_hash(content_hash: str) -> Optional[Dict]:
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("""
+            SELECT tp.id, tp.term, tp.exam_type, tp.total_questions, s.name AS subject_name
+            FROM term_papers tp LEFT JOIN subjects s ON s.id = tp.subject_id
+            WHERE tp.content_hash = %s
+        """, (content_hash,))
+        return cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
 
 
-def save_exam_to_database(exam_data: Dict, subject_name: str, term: str, exam_type: str) -> str:
-    """Save parsed exam data to PostgreSQL."""
+def save_exam_to_database(exam_data: Dict, subject_name: str, term: str, exam_type: str,
+                          content_hash: Optional[str] = None) -> str:
+    """
+    Save parsed exam data to PostgreSQL in one transaction. The paper is
+    upserted on its PDF content hash, so a re-upload updates the existing row
+    instead of duplicating the paper. Questions are upserted on
+    (paper_id, question_id) with a single multi-row statement, so they keep
+    their ids (attempt responses reference them); only questions missing from
+    the new parse are deleted.
+    """
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
@@ -247,40 +163,63 @@ def save_exam_to_database(exam_data: Dict, subject_name: str, term: str, exam_ty
             cur.execute("SELECT id FROM subjects WHERE code = %s", (subject_name.replace(" ", "_").upper()[:20],))
             subject_id = cur.fetchone()['id']
         
-        # Create term paper
-        paper_id = str(uuid.uuid4())
+        # Create (or update in place) the term paper
+        questions = unique_questions(exam_data.get("questions", []))
         cur.execute("""
-            INSERT INTO term_papers (id, subject_id, name, term, exam_type, duration_minutes, total_marks, total_questions, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+            INSERT INTO term_papers (id, subject_id, name, term, exam_type, duration_minutes, total_marks, total_questions, content_hash, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+            ON CONFLICT (content_hash) DO UPDATE SET
+                subject_id = EXCLUDED.subject_id,
+                name = EXCLUDED.name,
+                term = EXCLUDED.term,
+                exam_type = EXCLUDED.exam_type,
+                duration_minutes = EXCLUDED.duration_minutes,
+                total_marks = EXCLUDED.total_marks,
+                total_questions = EXCLUDED.total_questions,
+                updated_at = NOW()
+            RETURNING id
         """, (
-            paper_id,
+            str(uuid.uuid4()),
             subject_id,
             exam_data.get("name", "Exam Paper"),
             term,
             exam_type,
             exam_data.get("duration_minutes", 60),
             exam_data.get("total_marks", 50),
-            len(exam_data.get("questions", []))
+            len(questions),
+            content_hash
         ))
+        paper_id = str(cur.fetchone()['id'])
         
-        # Insert questions
-        for q in exam_data.get("questions", []):
-            question_uuid = str(uuid.uuid4())
-            cur.execute("""
-                INSERT INTO questions (id, paper_id, question_number, question_id, question_type, question_text, question_image, options, correct_answer, marks, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-            """, (
-                question_uuid,
-                paper_id,
-                q["question_number"],
-                q["question_id"],
-                q["question_type"],
-                q["question_text"],
-                q.get("image_url"),
-                Json(q.get("options", [])),
-                Json(q.get("correct_answer")),
-                q["marks"]
-            ))
+        # Drop questions no longer in the paper, then upsert the rest in one statement
+        cur.execute("""
+            DELETE FROM questions WHERE paper_id = %s AND question_id <> ALL(%s::text[])
+        """, (paper_id, [q["question_id"] for q in questions]))
+        execute_values(cur, """
+            INSERT INTO questions (id, paper_id, question_number, question_id, question_type, question_text, question_image, options, correct_answer, marks, section, created_at)
+            VALUES %s
+            ON CONFLICT (paper_id, question_id) DO UPDATE SET
+                question_number = EXCLUDED.question_number,
+                question_type = EXCLUDED.question_type,
+                question_text = EXCLUDED.question_text,
+                question_image = EXCLUDED.question_image,
+                options = EXCLUDED.options,
+                correct_answer = EXCLUDED.correct_answer,
+                marks = EXCLUDED.marks,
+                section = EXCLUDED.section
+        """, [(
+            str(uuid.uuid4()),
+            paper_id,
+            q["question_number"],
+            q["question_id"],
+            q["question_type"],
+            q["question_text"],
+            q.get("image_url"),
+            Json(q.get("options", [])),
+            Json(q.get("correct_answer")),
+            q["marks"],
+            q.get("section", "")
+        ) for q in questions], template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())", page_size=1000)
         
         conn.commit()
         return paper_id
@@ -293,31 +232,90 @@ def save_exam_to_database(exam_data: Dict, subject_name: str, term: str, exam_ty
         conn.close()
 
 
-async def process_pdf_upload(pdf_bytes: bytes, subject_name: str, term: str, exam_type: str) -> Dict:
+async def process_pdf_upload(pdf_bytes: bytes, subject_name: str, term: str, exam_type: str,
+                             progress=None, force: bool = False) -> Dict:
     """
     Main function to process PDF upload.
     1. Parse PDF
-    2. Extract and upload images to ImageKit
+    2. Match images to questions by position and upload them
     3. Save to database
+    
+    A PDF already stored with the same subject, term and exam type is a no-op
+    unless `force`. A PDF already stored under a different subject, term or
+    exam type is a conflict (success False, conflict True, the stored
+    metadata under "existing"); with `force` the stored paper is re-filed
+    under the new metadata. `progress`, if given, is called with keyword
+    updates (stage, done, total). Per-stage timings (seconds) are returned.
     """
+    report = progress or (lambda **_: None)
+    timings = {}
+    started = time.perf_counter()
+    content_hash = pdf_content_hash(pdf_bytes)
+    
+    existing = await asyncio.to_thread(find_paper_by_hash, content_hash)
+    if existing and not force:
+        timings["total"] = round(time.perf_counter() - started, 3)
+        stored = (existing["subject_name"], existing["term"], existing["exam_type"])
+        if stored != (subject_name, term, exam_type):
+            return {
+                "success": False,
+                "conflict": True,
+                "paper_id": str(existing["id"]),
+                "existing": {"subject_name": stored[0], "term": stored[1], "exam_type": stored[2]},
+                "message": "This PDF is already stored under other metadata; re-upload with force to re-file it",
+                "timings": timings
+            }
+        return {
+            "success": True,
+            "paper_id": str(existing["id"]),
+            "unchanged": True,
+            "questions_count": existing["total_questions"],
+            "timings": timings
+        }
+    
     # Parse PDF
-    exam_data = parse_pdf_with_images(pdf_bytes)
+    report(stage="parsing")
+    stage_started = time.perf_counter()
+    exam_data = await asyncio.to_thread(parse_pdf_with_images, pdf_bytes)
+    exam_data["questions"] = unique_questions(exam_data["questions"])  # what is stored, and counted below
+    timings["parse"] = round(time.perf_counter() - stage_started, 3)
     
-    # Upload images to ImageKit and update question image URLs
-    for idx, img in enumerate(exam_data.get("images", [])):
-        image_url = upload_image_to_imagekit(img["data"], img["filename"])
-        if image_url:
-            # Try to associate with nearest question (simplified)
-            # In production, you'd use bbox coordinates to match
-            if idx < len(exam_data["questions"]):
+    # Match images to questions, then upload only the matched ones (deduplicated, concurrent)
+    images = exam_data.get("images", [])
+    stage_started = time.perf_counter()
+    assigned = associate_images(exam_data["questions"], images, exam_data.get("page_count"))
+    timings["associate"] = round(time.perf_counter() - stage_started, 3)
+    report(stage="uploading_images", done=0, total=len(assigned), questions=len(exam_data["questions"]))
+    stage_started = time.perf_counter()
+    pipeline = get_image_pipeline()
+    upload_stats = {}
+    if pipeline and assigned:
+        indices = list(assigned)
+        image_urls, stats = await pipeline.upload_all([assigned[idx] for idx in indices],
+                                                      progress=lambda done: report(done=done))
+        upload_stats = stats.to_dict()
+        for idx, image_url in zip(indices, image_urls):
+            if image_url:
                 exam_data["questions"][idx]["image_url"] = image_url
+    timings["upload"] = round(time.perf_counter() - stage_started, 3)
     
     # Save to database
-    paper_id = save_exam_to_database(exam_data, subject_name, term, exam_type)
+    report(stage="saving", done=len(assigned))
+    stage_started = time.perf_counter()
+    paper_id = await asyncio.to_thread(save_exam_to_database, exam_data, subject_name, term, exam_type, content_hash)
+    timings["persist"] = round(time.perf_counter() - stage_started, 3)
+    timings["total"] = round(time.perf_counter() - started, 3)
+    logger.info(f"📝 Saved paper {paper_id}: {len(exam_data['questions'])} questions, timings {timings}")
     
     return {
         "success": True,
         "paper_id": paper_id,
+        "unchanged": False,
+        "updated": existing is not None,
         "questions_count": len(exam_data.get("questions", [])),
-        "images_uploaded": len([q for q in exam_data["questions"] if q.get("image_url")])
+        "images_found": len(images),
+        "images_matched": len(assigned),
+        "images_uploaded": len([q for q in exam_data["questions"] if q.get("image_url")]),
+        "image_upload": upload_stats,
+        "timings": timings
     }
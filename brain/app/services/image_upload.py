@@ -0,0 +1,219 @@
+"""
+Image Upload
+Concurrent upload stage for exam images. Identical images (the same logo or
+header on every page) are uploaded once by content hash; uploads run with
+bounded concurrency and retry with backoff. The uploader is pluggable:
+ImageKit in production, a local directory stand-in for tests and offline use;
+each run uploads through the uploader's session(), which owns any client.
+"""
+
+import os
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ImageKitUploader:
+    """Uploads raw bytes as multipart (no base64 data URI) with the async ImageKit client."""
+
+    name = "imagekit"
+
+    def __init__(self, private_key: str, folder: str = "/exam_questions/"):
+        from imagekitio import AsyncImageKit  # imported on first use; the SDK is heavy
+        self._client_class = AsyncImageKit
+        self.private_key = private_key
+        self.folder = folder
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[Callable[[bytes, str], Awaitable[Optional[str]]]]:
+        """
+        An upload function backed by one client for the run. Jobs run each
+        upload on their own event loop, so the client (and its connection
+        pool) lives and is closed within the run instead of per loop.
+        """
+        async with self._client_class(private_key=self.private_key, max_retries=0) as client:  # retries are ours
+            async def upload(data: bytes, filename: str) -> Optional[str]:
+                result = await client.files.upload(
+                    file=(filename, data),
+                    file_name=filename,
+                    folder=self.folder,
+                    use_unique_file_name=True,
+                )
+                return getattr(result, "url", None)
+            yield upload
+
+
+class LocalUploader:
+    """Stand-in that writes images to a local directory and returns their URL under `base_url`."""
+
+    name = "local"
+
+    def __init__(self, directory: str, base_url: Optional[str] = None, latency: float = 0.0):
+        self.directory = directory
+        self.base_url = (base_url or f"file://{os.path.abspath(directory)}").rstrip("/")
+        self.latency = latency  # simulated round trip, for benchmarking the pipeline
+        os.makedirs(directory, exist_ok=True)
+
+    def _write(self, data: bytes, filename: str):
+        with open(os.path.join(self.directory, filename), "wb") as f:
+            f.write(data)
+
+    async def upload(self, data: bytes, filename: str) -> Optional[str]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        await asyncio.to_thread(self._write, data, filename)
+        return f"{self.base_url}/{filename}"
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[Callable[[bytes, str], Awaitable[Optional[str]]]]:
+        yield self.upload
+
+
+@dataclass
+class UploadStats:
+    images: int = 0
+    unique: int = 0
+    uploaded: int = 0
+    deduplicated: int = 0  # images served by another copy in this batch or an earlier upload
+    failed: int = 0
+    retries: int = 0
+    bytes_uploaded: int = 0
+    seconds: float = 0.0
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["seconds"] = round(self.seconds, 3)
+        data["images_per_sec"] = round(self.images / self.seconds, 2) if self.seconds else 0.0
+        data["mb_per_sec"] = round(self.bytes_uploaded / 1e6 / self.seconds, 3) if self.seconds else 0.0
+        return data
+
+
+class ImageUploadPipeline:
+    def __init__(self, uploader, concurrency: Optional[int] = None, max_retries: Optional[int] = None,
+                 backoff_seconds: Optional[float] = None, remember: int = 5000):
+        self.uploader = uploader
+        self.concurrency = concurrency or Config.IMAGE_UPLOAD_CONCURRENCY
+        self.max_retries = Config.IMAGE_UPLOAD_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_seconds = backoff_seconds or Config.IMAGE_UPLOAD_BACKOFF_SECONDS
+        self.remember = remember
+        self._known: "OrderedDict[str, str]" = OrderedDict()  # content hash -> URL, across uploads
+        self._lock = threading.Lock()
+        self.last_stats = UploadStats()
+
+    def _known_url(self, digest: str) -> Optional[str]:
+        with self._lock:
+            url = self._known.get(digest)
+            if url:
+                self._known.move_to_end(digest)
+            return url
+
+    def _remember(self, digest: str, url: str):
+        with self._lock:
+            self._known[digest] = url
+            while len(self._known) > self.remember:
+                self._known.popitem(last=False)
+
+    async def _upload_one(self, upload, data: bytes, filename: str, stats: UploadStats) -> Optional[str]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                url = await upload(data, filename)
+                if url:
+                    stats.uploaded += 1
+                    stats.bytes_uploaded += len(data)
+                return url
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.warning(f"⚠️ Failed to upload image {filename}: {e}")
+                    stats.failed += 1
+                    return None
+                stats.retries += 1
+                await asyncio.sleep(self.backoff_seconds * (2 ** attempt) * (0.5 + random.random()))
+
+    async def upload_all(self, images: List[Dict],
+                         progress: Optional[Callable[[int], None]] = None) -> Tuple[List[Optional[str]], UploadStats]:
+        """
+        Upload `images` ({"data", "filename"}) and return one URL (or None) per
+        image in input order, plus this run's stats. `progress(done)` is called
+        as unique images finish.
+        """
+        started = time.perf_counter()
+        stats = UploadStats(images=len(images))
+        groups: "OrderedDict[str, List[int]]" = OrderedDict()
+        for idx, img in enumerate(images):
+            groups.setdefault(hashlib.sha256(img["data"]).hexdigest(), []).append(idx)
+        stats.unique = len(groups)
+
+        urls: List[Optional[str]] = [None] * len(images)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        done = 0
+
+        async def upload_group(digest: str, indices: List[int]):
+            nonlocal done
+            url = self._known_url(digest)
+            if url:
+                stats.deduplicated += len(indices)
+            else:
+                first = images[indices[0]]
+                ext = os.path.splitext(first["filename"])[1]
+                async with semaphore:
+                    url = await self._upload_one(upload, first["data"], f"{digest[:16]}{ext or '.png'}", stats)
+                if url:
+                    self._remember(digest, url)
+                    stats.deduplicated += len(indices) - 1
+            for idx in indices:
+                urls[idx] = url
+            done += 1
+            if progress:
+                progress(done)
+
+        async with self.uploader.session() as upload:
+            await asyncio.gather(*(upload_group(digest, indices) for digest, indices in groups.items()))
+        stats.seconds = time.perf_counter() - started
+        self.last_stats = stats
+        logger.info(
+            f"🖼️ Images: {stats.images} total, {stats.uploaded} uploaded, {stats.deduplicated} deduplicated, "
+            f"{stats.failed} failed in {stats.seconds:.2f}s ({stats.bytes_uploaded / 1024:.0f} KiB)"
+        )
+        return urls, stats
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def create_uploader():
+    """IMAGE_UPLOADER=imagekit|local|none; by default ImageKit when a key is configured."""
+    kind = Config.IMAGE_UPLOADER or ("imagekit" if Config.IMAGEKIT_PRIVATE_KEY else "none")
+    if kind == "imagekit":
+        try:
+            uploader = ImageKitUploader(Config.IMAGEKIT_PRIVATE_KEY)
+            logger.info("✅ ImageKit initialized successfully")
+            return uploader
+        except Exception as e:
+            logger.warning(f"⚠️ ImageKit initialization failed: {e}")
+            return None
+    if kind == "local":
+        return LocalUploader(Config.IMAGE_UPLOAD_LOCAL_DIR, base_url=Config.IMAGE_UPLOAD_LOCAL_URL or None)
+    logger.warning("⚠️ ImageKit not configured - images will not be uploaded")
+    return None
+
+
+def get_image_pipeline() -> Optional[ImageUploadPipeline]:
+    """Process-wide pipeline, created on first upload; None when no uploader is configured."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            uploader = create_uploader()
+            _pipeline = ImageUploadPipeline(uploader) if uploader else False
+        return _pipeline or None
@@ -1,58 +1,190 @@
 import os
+import hashlib
+from collections import defaultdict
 from llama_index.core import SimpleDirectoryReader, StorageContext
 from llama_index.embeddings.gemini import GeminiEmbedding
 from llama_index.llms.gemini import Gemini
 from llama_index.core.node_parser import SentenceSplitter
 from app.core.config import Config
+from app.core.database import get_engine
+from app.services.embeddings import EmbeddingPipeline
+from app.services.embedding_cache import CachedEmbedding
+from app.services.resource_writer import ResourceWriter
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class IngestionService:
-    def __init__(self):
-        self.embed_model = GeminiEmbedding(model_name="models/text-embedding-004", api_key=Config.GEMINI_API_KEY)
-        self.engine = create_engine(Config.get_sqlalchemy_url())
+    def __init__(self, max_in_flight=None):
+        self.embed_model = CachedEmbedding(GeminiEmbedding(model_name="models/text-embedding-004", api_key=Config.GEMINI_API_KEY))
+        self.embedding_pipeline = EmbeddingPipeline(self.embed_model, max_in_flight=max_in_flight)
+        self.engine = get_engine()
+        self.last_ingest = {}
 
-    def ingest_folder(self, folder_path, category):
+    def ingest_folder(self, folder_path, category, prune=True, progress=None):
         logger.info(f"Starting ingestion for category: {category} from {folder_path}")
+        if progress:
+            progress(stage="loading")
         reader = SimpleDirectoryReader(input_dir=folder_path)
         documents = reader.load_data()
-        return self.ingest_documents(documents, category)
+        # Chunk sources are absolute file paths, so the folder scopes what this run may prune
+        source_prefix = os.path.join(os.path.abspath(folder_path), "")
+        return self.ingest_documents(documents, category, prune=prune, source_prefix=source_prefix, progress=progress)
 
-    def ingest_documents(self, documents, category):
+    @staticmethod
+    def content_hash(source, content):
+        """Stable identity of a chunk: its source plus its text."""
+        return hashlib.sha256(f"{source}\x00{content}".encode("utf-8")).hexdigest()
+
+    def _load_existing_hashes(self, category):
+        """Map content_hash -> [(id, source)] for live, hash-tracked rows of a category."""
+        query = text("""
+            SELECT id, source, content_hash
+            FROM resources
+            WHERE category = :category AND deleted_at IS NULL AND content_hash IS NOT NULL
+        """)
+        existing = defaultdict(list)
+        with self.engine.connect() as conn:
+            for row in conn.execute(query, {"category": category}):
+                existing[row.content_hash].append((row.id, row.source))
+        return existing
+
+    def _load_unhashed(self, category):
+        """
+        Map (title, md5 of content) -> [ids] for live rows of a category written
+        before chunks were hash-tracked (content_hash IS NULL).
+        """
+        query = text("""
+            SELECT id, title, md5(content) AS content_md5
+            FROM resources
+            WHERE category = :category AND deleted_at IS NULL AND content_hash IS NULL
+        """)
+        unhashed = defaultdict(list)
+        with self.engine.connect() as conn:
+            for row in conn.execute(query, {"category": category}):
+                unhashed[(row.title, row.content_md5)].append(row.id)
+        return unhashed
+
+    def _backfill(self, rows):
+        """Give legacy rows the source and content_hash of the chunk they match, instead of re-embedding it."""
+        if not rows:
+            return
+        query = text("""
+            UPDATE resources SET source = :source, content_hash = :content_hash, updated_at = NOW()
+            WHERE id = :id
+        """)
+        with self.engine.begin() as conn:
+            conn.execute(query, [{"id": row_id, "source": source, "content_hash": chunk_hash}
+                                 for row_id, source, chunk_hash in rows])
+
+    def _soft_delete(self, ids):
+        if not ids:
+            return
+        query = text("""
+            UPDATE resources SET deleted_at = NOW(), updated_at = NOW()
+            WHERE id = ANY(:ids)
+        """)
+        with self.engine.begin() as conn:
+            conn.execute(query, {"ids": list(ids)})
+
+    def ingest_documents(self, documents, category, prune=False, source_prefix=None, progress=None):
+        """
+        Incrementally ingest documents into a category.
+
+        Unchanged chunks (same source + text) are skipped, new or changed chunks
+        are embedded and inserted. With `prune`, hash-tracked chunks that are no
+        longer produced (changed text or removed source) are soft-deleted; only
+        pass it when this run owns every source it could prune. `source_prefix`
+        narrows pruning to chunks whose source starts with it, so other feeds
+        into the same category (a GitHub sync, another folder) are left alone.
+        A chunk's source is its `source` metadata if set (e.g. a repo-scoped
+        path), else its file path.
+
+        Rows written before hash tracking are matched by title and text: a
+        chunk that is still produced is backfilled onto its legacy row rather
+        than inserted again, and with `prune` the unmatched legacy rows of
+        the category are retired (they carry no source to scope them by).
+
+        `progress`, if given, is called with keyword updates (stage, done, total)
+        as batches are written.
+        """
         # 2. Split into chunks (Sentence-aware)
         parser = SentenceSplitter(chunk_size=512, chunk_overlap=50)
         nodes = parser.get_nodes_from_documents(documents)
         
-        # 3. Process each chunk
+        # 3. Diff against what is already stored
+        existing = self._load_existing_hashes(category)
+        unhashed = self._load_unhashed(category)
+        seen = set()
+        pending = []  # (title, source, content_hash, content)
+        backfilled = []  # (legacy id, source, content_hash)
         for node in nodes:
             content = node.get_content()
-            embedding = self.embed_model.get_text_embedding(content)
-            
-            # 4. Save to our Go-compatible 'resources' table
-            # We map: category -> category, metadata.file_name -> title
-            embed_str = str(embedding).replace(" ", "")
-            
-            query = text("""
-                INSERT INTO resources (created_at, updated_at, category, title, content, embedding)
-                VALUES (NOW(), NOW(), :category, :title, :content, :embedding)
-            """)
-            
-            with self.engine.connect() as conn:
-                conn.execute(query, {
-                    "category": category,
-                    "title": node.metadata.get("file_name", "Unknown"),
-                    "content": content,
-                    "embedding": embed_str
-                })
-                conn.commit()
-            
-            logger.info(f"Chunk saved: {node.metadata.get('file_name', 'Unknown')}")
+            source = (node.metadata.get("source") or node.metadata.get("file_path")
+                      or node.metadata.get("file_name", "Unknown"))
+            chunk_hash = self.content_hash(source, content)
+            if chunk_hash in seen:
+                continue
+            seen.add(chunk_hash)
+            if chunk_hash in existing:
+                continue
+            title = node.metadata.get("file_name", "Unknown")
+            legacy = unhashed.get((title, hashlib.md5(content.encode("utf-8")).hexdigest()))
+            if legacy:
+                backfilled.append((legacy.pop(0), source, chunk_hash))
+            else:
+                pending.append((title, source, chunk_hash, content))
+        
+        # Keep one live row per hash; drop duplicates and (optionally) stale chunks
+        stale_ids = []
+        for chunk_hash, rows in existing.items():
+            ids = [row_id for row_id, _ in rows]
+            owned = prune and (source_prefix is None or (rows[0][1] or "").startswith(source_prefix))
+            if chunk_hash in seen or not owned:
+                stale_ids.extend(ids[1:])
+            else:
+                stale_ids.extend(ids)
+        if prune:
+            stale_ids.extend(row_id for ids in unhashed.values() for row_id in ids)
+        
+        # 4. Embed new/changed chunks in batches and bulk-write each batch as it completes
+        # We map: category -> category, metadata.file_name -> title
+        contents = [p[3] for p in pending]
+        if progress:
+            progress(stage="embedding", done=0, total=len(pending), chunks=len(nodes))
+        
+        done = 0
+        with ResourceWriter(self.engine) as writer:
+            for start, embeddings in self.embedding_pipeline.embed_batches(contents):
+                for offset, embedding in enumerate(embeddings):
+                    title, source, chunk_hash, content = pending[start + offset]
+                    writer.add(category, title, content, embedding, source=source, content_hash=chunk_hash)
+                done += len(embeddings)
+                if progress:
+                    progress(done=done)
+        
+        self._backfill(backfilled)
+        self._soft_delete(stale_ids)
         
-        logger.info(f"Successfully {category} ingestion complete.")
+        self.last_ingest = {
+            "chunks": len(nodes),
+            "inserted": len(pending),
+            "backfilled": len(backfilled),
+            "unchanged": len(seen) - len(pending) - len(backfilled),
+            "deleted": len(stale_ids),
+        }
+        stats = self.embedding_pipeline.last_stats
+        logger.info(
+            f"Successfully {category} ingestion complete. "
+            f"{len(pending)} new/changed, {len(backfilled)} backfilled, {self.last_ingest['unchanged']} unchanged, "
+            f"{len(stale_ids)} removed "
+            f"({stats.chunks_per_sec:.1f} chunks/sec embedded)"
+        )
+        if progress:
+            progress(stage="done", **self.last_ingest)
         return len(nodes)
 
 if __name__ == "__main__":
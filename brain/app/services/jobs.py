@@ -0,0 +1,233 @@
+"""
+Background Jobs
+Bounded worker pool for long-running admin work (folder ingestion, exam PDF
+uploads). Submitting returns a job id immediately; progress, throughput and
+errors are polled via /jobs/{id}. Jobs are mirrored to SQLite so their final
+state survives a restart, and so any API worker can answer for a job run by
+another; jobs whose worker process is gone are marked failed.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _alive(pid: Optional[int]) -> bool:
+    if not pid or pid == os.getpid():
+        return False  # our own pid from a previous run, recycled
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    params: Dict = field(default_factory=dict)
+    status: str = QUEUED
+    progress: Dict = field(default_factory=dict)
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    worker: int = field(default_factory=os.getpid)  # pid of the API worker running it
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> Dict:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        done = self.progress.get("done")
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "progress": self.progress,
+            "elapsed_seconds": round(elapsed, 2),
+            "throughput_per_sec": round(done / elapsed, 2) if done and elapsed else 0.0,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "worker": self.worker,
+        }
+
+
+class JobContext:
+    """Handed to the job function so it can report progress: ctx.report(done=..., total=..., stage=...)."""
+
+    def __init__(self, queue: "JobQueue", job: Job):
+        self._queue = queue
+        self.job = job
+
+    def report(self, **progress):
+        self.job.progress.update(progress)
+        self._queue._persist(self.job, throttle=True)
+
+
+class JobQueue:
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 path: Optional[str] = None, keep: int = 200):
+        self.max_workers = max_workers or Config.JOB_WORKERS
+        self.max_pending = max_pending or Config.JOB_MAX_PENDING
+        self.keep = keep
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._persisted_at: Dict[str, float] = {}
+
+        path = Config.JOB_DB_PATH if path is None else path
+        self._db = None
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("""
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        kind TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        data TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                """)
+                # Other API workers may be running jobs right now; only orphans are failed
+                orphaned = [
+                    (job_id,) for job_id, worker in self._db.execute(
+                        "SELECT id, json_extract(data, '$.worker') FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+                    ).fetchall() if not _alive(worker)
+                ]
+                self._db.executemany(
+                    "UPDATE jobs SET status = ?, data = json_set(data, '$.status', ?, '$.error', ?) WHERE id = ?",
+                    [(FAILED, FAILED, "interrupted by restart", job_id) for job_id, in orphaned],
+                )
+                self._db.commit()
+                interrupted = len(orphaned)
+                if interrupted:
+                    logger.warning(f"⚠️ {interrupted} background jobs were interrupted by a restart")
+            except Exception as e:
+                logger.warning(f"⚠️ Job persistence disabled ({path}): {e}")
+                self._db = None
+
+    def _persist(self, job: Job, throttle: bool = False):
+        if self._db is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if throttle and now - self._persisted_at.get(job.id, 0.0) < 1.0:
+                return
+            self._persisted_at[job.id] = now
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?)",
+                    (job.id, job.kind, job.status, json.dumps(job.to_dict(), default=str), job.created_at),
+                )
+                self._db.commit()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not persist job {job.id}: {e}")
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def submit(self, kind: str, fn: Callable, *args, params: Optional[Dict] = None, **kwargs) -> Job:
+        """
+        Queue `fn(ctx, *args, **kwargs)`. Coroutine functions run on a private
+        event loop in the worker thread, never on the server's loop.
+        """
+        if self.pending() >= self.max_pending:
+            raise QueueFull(f"{self.max_pending} jobs already pending, retry later")
+        job = Job(id=uuid.uuid4().hex, kind=kind, params=params or {})
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.finished:
+                    break
+                self._jobs.popitem(last=False)
+                self._persisted_at.pop(oldest.id, None)
+        self._persist(job)
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        logger.info(f"📥 Job {job.id} ({kind}) queued")
+        return job
+
+    def _run(self, job: Job, fn: Callable, args, kwargs):
+        job.status = RUNNING
+        job.started_at = time.time()
+        self._persist(job)
+        ctx = JobContext(self, job)
+        try:
+            result = fn(ctx, *args, **kwargs)
+            if asyncio.iscoroutine(result):
+                result = asyncio.run(result)
+            job.result = result
+            job.status = SUCCEEDED
+            logger.info(f"✅ Job {job.id} ({job.kind}) finished in {time.time() - job.started_at:.1f}s")
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+            logger.error(f"❌ Job {job.id} ({job.kind}) failed: {e}\n{traceback.format_exc()}")
+        finally:
+            job.finished_at = time.time()
+            self._persist(job)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self._db is not None:
+            with self._lock:
+                row = self._db.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row:
+                return json.loads(row[0])
+        return None
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        """Newest first; with persistence this includes jobs run by the other API workers."""
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+            local = {job.id: job.to_dict() for job in jobs}
+            if self._db is None:
+                return [local[job.id] for job in reversed(jobs)]
+            rows = self._db.execute("SELECT id, data FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        merged = {job_id: local.get(job_id) or json.loads(data) for job_id, data in rows}
+        merged.update(local)
+        return sorted(merged.values(), key=lambda job: job["created_at"], reverse=True)[:limit]
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
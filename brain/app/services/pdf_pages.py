@@ -0,0 +1,130 @@
+"""
+PDF Pages
+Page-parallel text and image extraction with pdfplumber. The PDF is opened
+from an in-memory buffer; page ranges are spread across a process pool and
+merged back in page order. Kept free of heavy app imports so pool workers
+start quickly, and pdfplumber itself is imported on first parse.
+"""
+
+import io
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+@dataclass
+class PageContent:
+    page_num: int
+    text: str
+    images: List[Dict] = field(default_factory=list)
+    lines: List[Tuple[str, float]] = field(default_factory=list)  # (text, top) per text line, top-down
+
+
+def extract_images_from_page(page, page_num: int) -> List[Dict]:
+    """Extract images from a PDF page."""
+    images = []
+
+    try:
+        page_images = page.images
+        for idx, img in enumerate(page_images):
+            # Get image data
+            image_bytes = img.get("stream", None)
+            if image_bytes:
+                # Try to extract raw image data
+                try:
+                    raw_data = image_bytes.get_data()
+                    filename = f"page_{page_num}_img_{idx}.png"
+                    images.append({
+                        "data": raw_data,
+                        "filename": filename,
+                        "page": page_num,
+                        "bbox": (img["x0"], img["top"], img["x1"], img["bottom"])
+                    })
+                except:
+                    pass
+    except Exception as e:
+        print(f"Error extracting images from page {page_num}: {e}")
+
+    return images
+
+
+def parse_page_range(pdf_bytes: bytes, start: int, stop: int) -> List[PageContent]:
+    """Extract text and images for pages [start, stop). Runs in a pool worker."""
+    import pdfplumber  # deferred: only processes that parse PDFs pay for the import
+    pages = []
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        for page_num in range(start, min(stop, len(pdf.pages))):
+            page = pdf.pages[page_num]
+            # Same text as extract_text(), plus each line's y position for image matching
+            lines = [(line["text"], line["top"]) for line in page.extract_text_lines(return_chars=False)]
+            text = "\n".join(line for line, _ in lines)
+            pages.append(PageContent(page_num, text, extract_images_from_page(page, page_num), lines))
+            page.close()  # release the page's parsed layout; ranges can be long
+    return pages
+
+
+def count_pages(pdf_bytes: bytes) -> int:
+    import pdfplumber
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        return len(pdf.pages)
+
+
+def default_workers() -> int:
+    """One process per CPU, split between API workers so they do not oversubscribe the host."""
+    return Config.PDF_PARSE_WORKERS or max(1, (os.cpu_count() or 1) // max(1, Config.WEB_CONCURRENCY))
+
+
+def get_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Process-wide pool, created on first use. Spawned (not forked) because the server is multi-threaded."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers or default_workers(),
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def page_ranges(total: int, parts: int) -> List[Tuple[int, int]]:
+    size = max(1, -(-total // parts))
+    return [(start, min(start + size, total)) for start in range(0, total, size)]
+
+
+def parse_pages(pdf_bytes: bytes, workers: Optional[int] = None, executor=None) -> List[PageContent]:
+    """
+    All pages in order. Small documents (under PDF_PARALLEL_MIN_PAGES) or a
+    single worker are parsed in-process; otherwise each worker gets about two
+    page ranges so a slow range does not hold up the rest.
+    """
+    started = time.perf_counter()
+    workers = workers or default_workers()
+    total = count_pages(pdf_bytes)
+    if workers <= 1 or total < Config.PDF_PARALLEL_MIN_PAGES:
+        pages = parse_page_range(pdf_bytes, 0, total)
+    else:
+        executor = executor or get_pool(workers)
+        futures = [executor.submit(parse_page_range, pdf_bytes, start, stop)
+                   for start, stop in page_ranges(total, workers * 2)]
+        pages = [page for future in futures for page in future.result()]
+    elapsed = time.perf_counter() - started
+    logger.info(f"📄 Parsed {total} pages in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.1f} pages/sec)")
+    return pages
@@ -0,0 +1,115 @@
+"""
+Prompt Templates
+Registry of chat prompts. Each template has a static prefix (persona and
+instructions) that is whitespace-normalised once at import and kept
+byte-identical across requests, followed by the per-request sections.
+Providers with prefix caching (Groq, Cerebras, Gemini implicit caching)
+can then reuse the processed prefix across requests.
+"""
+
+import hashlib
+import textwrap
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+GREETINGS = {"hi", "hello", "hey", "who are you", "what is your name"}
+
+GREETING_ANSWER = (
+    "Hello and Welcome. My name is **Spirit**, and I'm thrilled to be your academic mentor. I'm here to support "
+    "and guide you throughout your learning journey, providing you with helpful insights, explanations, and "
+    "resources to help you succeed.\n\nPlease feel free to ask me any questions, share your concerns, or discuss "
+    "topics that interest you. I'm all ears and ready to help. What's on your mind today?"
+)
+
+SPIRIT_PERSONA = """
+    You are Spirit, a warm, supportive, and highly knowledgeable academic mentor. You are not just an AI answering questions; you are a partner in the student's learning journey.
+
+    CORE PERSONA:
+    - **Human & Natural**: Speak like a helpful professor or a brilliant senior student. Avoid robotic phrases like "As an AI" or "Based on the context provided".
+    - **Supportive & Encouraging**: If a student is stressed, offer reassurance along with the answer. Validate their efforts.
+    - **Clear & Structured**: Use Markdown effectively (bolding key terms, using lists) to make complex information easy to digest.
+    - **Context-Aware**: Use the provided CONTEXT to answer accurately, but integrate it naturally into your explanation.
+
+    INSTRUCTIONS:
+    - **Prioritize Context**: If the student's question relates to the CONTEXT, use that information as the primary source.
+    - **General Knowledge**: If the question is general (e.g., "how to stay motivated", "explain gravity"), use your own vast knowledge.
+    - **Formatting**: ALWAYS use Markdown to structure your response.
+    - **No Meta-Talk**: Never mention "context blocks", "uploaded files", or "retrieved documents". Just provide the answer.
+"""
+
+
+def normalise(text: str) -> str:
+    """Dedent, strip trailing spaces and surrounding blank lines; the result is what gets hashed and sent."""
+    lines = [line.rstrip() for line in textwrap.dedent(text).strip("\n").splitlines()]
+    return "\n".join(lines) + "\n"
+
+
+def is_greeting(query: str) -> bool:
+    return query.lower().strip().rstrip("?") in GREETINGS
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    name: str
+    prefix: str
+    sections: Tuple[Tuple[str, str], ...]  # (key, heading), rendered in order after the prefix
+    prefix_hash: str = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "prefix", normalise(self.prefix))
+        object.__setattr__(self, "prefix_hash", hashlib.sha256(self.prefix.encode("utf-8")).hexdigest()[:12])
+
+    def render(self, **values: str) -> str:
+        """Static prefix + dynamic sections. Plain concatenation, so braces in user text are never interpreted."""
+        parts = [self.prefix]
+        for key, heading in self.sections:
+            parts.append(f"\n{heading}\n{(values.get(key) or '').strip()}\n")
+        return "".join(parts)
+
+
+_registry: Dict[str, PromptTemplate] = {}
+
+
+def register(template: PromptTemplate) -> PromptTemplate:
+    _registry[template.name] = template
+    return template
+
+
+def get_prompt(name: str) -> PromptTemplate:
+    return _registry[name]
+
+
+def registered_prompts() -> Dict[str, Dict]:
+    return {name: {"prefix_hash": t.prefix_hash, "prefix_chars": len(t.prefix)} for name, t in _registry.items()}
+
+
+CHAT_PROMPT = register(PromptTemplate(
+    name="chat",
+    prefix=SPIRIT_PERSONA,
+    sections=(
+        ("history", "CONVERSATION HISTORY:"),
+        ("context", "CONTEXT FROM ACADEMIC DOCS:"),
+        ("question", "STUDENT QUESTION:"),
+    ),
+))
+
+
+def _field(obj, name):
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def cached_prompt_tokens(response) -> Optional[int]:
+    """
+    Prompt tokens the provider served from its prefix cache, when it reports
+    them: OpenAI-style usage (Groq, Cerebras) or Gemini usage metadata.
+    """
+    raw = getattr(response, "raw", None)
+    if raw is None:
+        return None
+    details = _field(_field(raw, "usage") or {}, "prompt_tokens_details")
+    if details:
+        return _field(details, "cached_tokens")
+    metadata = _field(raw, "usage_metadata")
+    if metadata is not None:
+        return _field(metadata, "cached_content_token_count")
+    return None
@@ -0,0 +1,239 @@
+"""
+Provider Router
+Tracks health per LLM provider (rolling error rate, latency EWMA, quota
+state) and orders providers by expected latency. Repeated rate-limit errors
+open a circuit so requests stop paying for calls that are bound to fail;
+after a cooldown a single half-open probe decides whether to close it again.
+With a shared store (multi-worker mode) every update is a read-modify-write
+of the provider's shared record, so all workers see the same circuits; the
+async variants (atry_acquire, arecord_success, ...) then run in a thread so
+SQLite I/O and cross-process lock waits stay off the event loop.
+"""
+
+import re
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from app.core.config import Config
+from app.services.embeddings import is_rate_limit_error
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+RETRY_AFTER_PATTERN = re.compile(r"retry(?:[ _-]?after|[ _-]?delay|\s+in)\D{0,20}?(\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+
+
+class ProviderHealth:
+    def __init__(self, name: str, priority: int, window: int):
+        self.name = name
+        self.priority = priority
+        self.outcomes = deque(maxlen=window)  # (timestamp, success)
+        self.latency_ewma: Optional[float] = None
+        self.consecutive_rate_limits = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.cooldown = Config.LLM_CIRCUIT_COOLDOWN_SECONDS
+        self.quota_reset_at = 0.0
+        self.probe_in_flight = False
+        self.probe_started_at = 0.0
+        self.last_error: Optional[str] = None
+
+    STATE_FIELDS = ("latency_ewma", "consecutive_rate_limits", "state", "opened_at", "cooldown",
+                    "quota_reset_at", "probe_in_flight", "probe_started_at", "last_error")
+
+    def to_state(self) -> Dict:
+        """Serializable health, for the shared store."""
+        state = {name: getattr(self, name) for name in self.STATE_FIELDS}
+        state["outcomes"] = list(self.outcomes)
+        return state
+
+    def load_state(self, state: Dict):
+        for name in self.STATE_FIELDS:
+            if name in state:
+                setattr(self, name, state[name])
+        self.outcomes.clear()
+        self.outcomes.extend((ts, ok) for ts, ok in state.get("outcomes", []))
+
+    def _recent(self) -> List[bool]:
+        """Outcomes inside the rolling time window, so old failures stop penalising a provider."""
+        cutoff = time.time() - Config.LLM_HEALTH_WINDOW_SECONDS
+        return [ok for ts, ok in self.outcomes if ts >= cutoff]
+
+    @property
+    def error_rate(self) -> float:
+        recent = self._recent()
+        if not recent:
+            return 0.0
+        return 1 - sum(recent) / len(recent)
+
+    def expected_latency(self) -> float:
+        """Latency EWMA inflated by the chance of having to fall through to the next provider."""
+        latency = self.latency_ewma if self.latency_ewma is not None else Config.LLM_LATENCY_PRIOR_SECONDS
+        return latency * (1 + 4 * self.error_rate)
+
+    def to_dict(self) -> Dict:
+        now = time.time()
+        return {
+            "name": self.name,
+            "state": self.state,
+            "error_rate": round(self.error_rate, 3),
+            "samples": len(self._recent()),
+            "latency_ewma_seconds": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "expected_latency_seconds": round(self.expected_latency(), 3),
+            "consecutive_rate_limits": self.consecutive_rate_limits,
+            "retry_in_seconds": round(max(0.0, self.opened_at + self.cooldown - now), 1) if self.state == OPEN else 0.0,
+            "quota_reset_in_seconds": round(max(0.0, self.quota_reset_at - now), 1),
+            "last_error": self.last_error,
+        }
+
+
+class ProviderRouter:
+    def __init__(self, providers: List[tuple], shared=None):
+        self.providers = list(providers)  # (llm_instance, provider_name), in configured priority order
+        self.health: Dict[str, ProviderHealth] = {
+            name: ProviderHealth(name, idx, Config.LLM_HEALTH_WINDOW) for idx, (_, name) in enumerate(self.providers)
+        }
+        self._lock = threading.RLock()
+        self.shared = shared  # app.core.shared_state.SharedStore, or None for per-process health
+        self._synced_at = 0.0
+
+    def _key(self, name: str) -> str:
+        return f"provider_health:{name}"
+
+    def _sync(self):
+        """Refresh every provider from the shared store, at most every SHARED_STATE_SYNC_SECONDS."""
+        now = time.monotonic()
+        if self.shared is None or now - self._synced_at < Config.SHARED_STATE_SYNC_SECONDS:
+            return
+        self._synced_at = now
+        shared = self.shared.get_prefix("provider_health:")
+        for name, health in self.health.items():
+            state = shared.get(self._key(name))
+            if state:
+                health.load_state(state)
+
+    @contextmanager
+    def _update(self, name: str):
+        """Yield the provider's health for modification; with a store, under its cross-process lock."""
+        with self._lock:
+            health = self.health[name]
+            if self.shared is None:
+                yield health
+                return
+            with self.shared.locked():
+                state = self.shared.get(self._key(name))
+                if state:
+                    health.load_state(state)
+                yield health
+                self.shared.set(self._key(name), health.to_state())
+
+    def _sorted(self) -> List[tuple]:
+        def sort_key(provider):
+            health = self.health[provider[1]]
+            return (health.state == OPEN, health.expected_latency(), health.priority)
+        return sorted(self.providers, key=sort_key)
+
+    def ordered(self) -> List[tuple]:
+        """Providers sorted by expected latency; open circuits go last (they are skipped by try_acquire)."""
+        with self._lock:
+            self._sync()
+            return self._sorted()
+
+    def try_acquire(self, name: str) -> bool:
+        """Whether a call to this provider may go out now; claims the half-open probe slot."""
+        with self._update(name) as health:
+            now = time.time()
+            if health.state == OPEN:
+                if now < max(health.opened_at + health.cooldown, health.quota_reset_at):
+                    return False
+                health.state = HALF_OPEN
+                health.probe_in_flight = False
+                logger.info(f"🔌 {name} circuit half-open, probing...")
+            if health.state == HALF_OPEN:
+                # A probe abandoned by a crashed worker is reclaimed after a cooldown
+                if health.probe_in_flight and now - health.probe_started_at < health.cooldown:
+                    return False
+                health.probe_in_flight = True
+                health.probe_started_at = now
+            return True
+
+    def release(self, name: str):
+        """Give back a claimed probe slot when the call was abandoned without an outcome."""
+        with self._update(name) as health:
+            health.probe_in_flight = False
+
+    def record_success(self, name: str, latency: float):
+        with self._update(name) as health:
+            alpha = Config.LLM_LATENCY_EWMA_ALPHA
+            health.latency_ewma = latency if health.latency_ewma is None else alpha * latency + (1 - alpha) * health.latency_ewma
+            health.outcomes.append((time.time(), True))
+            health.consecutive_rate_limits = 0
+            health.probe_in_flight = False
+            if health.state != CLOSED:
+                logger.info(f"✅ {name} circuit closed")
+                health.state = CLOSED
+                health.cooldown = Config.LLM_CIRCUIT_COOLDOWN_SECONDS
+
+    def record_failure(self, name: str, error: Exception):
+        with self._update(name) as health:
+            now = time.time()
+            health.outcomes.append((now, False))
+            health.last_error = str(error)[:200]
+            health.probe_in_flight = False
+
+            if not is_rate_limit_error(error):
+                health.consecutive_rate_limits = 0
+                if health.state == HALF_OPEN:
+                    self._open(health, now)
+                return
+
+            health.consecutive_rate_limits += 1
+            retry_after = RETRY_AFTER_PATTERN.search(str(error))
+            if retry_after:
+                health.quota_reset_at = now + float(retry_after.group(1))
+
+            if health.state == HALF_OPEN:
+                # Failed probe: back off harder
+                health.cooldown = min(health.cooldown * 2, Config.LLM_CIRCUIT_MAX_COOLDOWN_SECONDS)
+                self._open(health, now)
+            elif health.consecutive_rate_limits >= Config.LLM_CIRCUIT_FAILURE_THRESHOLD:
+                self._open(health, now)
+
+    def _open(self, health: ProviderHealth, now: float):
+        health.state = OPEN
+        health.opened_at = now
+        logger.warning(f"🚫 {health.name} circuit open for {health.cooldown:.0f}s")
+
+    async def _offload(self, fn, *args):
+        """Call a health method from async code; with a shared store it runs in a thread."""
+        if self.shared is None:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def aordered(self) -> List[tuple]:
+        return await self._offload(self.ordered)
+
+    async def atry_acquire(self, name: str) -> bool:
+        return await self._offload(self.try_acquire, name)
+
+    async def arelease(self, name: str):
+        await self._offload(self.release, name)
+
+    async def arecord_success(self, name: str, latency: float):
+        await self._offload(self.record_success, name, latency)
+
+    async def arecord_failure(self, name: str, error: Exception):
+        await self._offload(self.record_failure, name, error)
+
+    def status(self) -> List[Dict]:
+        with self._lock:
+            self._sync()
+            return [self.health[name].to_dict() for _, name in self._sorted()]
@@ -0,0 +1,122 @@
+"""
+Resource Writer
+Bulk-loads rows into the `resources` table with binary COPY, one transaction
+per flush. Vectors are sent in pgvector's binary wire format.
+"""
+
+import io
+import struct
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+
+
+def encode_text(value: Optional[str]) -> Optional[bytes]:
+    return None if value is None else value.encode("utf-8")
+
+
+def encode_timestamptz(value: datetime) -> bytes:
+    """Postgres binary timestamptz: int64 microseconds since 2000-01-01 UTC."""
+    delta = value - PG_EPOCH
+    return struct.pack(">q", (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds)
+
+
+def encode_vector(embedding) -> bytes:
+    """pgvector binary format: int16 dim, int16 unused, dim x float4 (big-endian)."""
+    dim = len(embedding)
+    return struct.pack(f">HH{dim}f", dim, 0, *embedding)
+
+
+class ResourceWriter:
+    """
+    Buffers resource rows and writes them with COPY ... (FORMAT binary).
+
+    Usage:
+        with ResourceWriter(engine) as writer:
+            writer.add(category, title, content, embedding, source=source, content_hash=content_hash)
+    """
+
+    COLUMNS = ("created_at", "updated_at", "category", "title", "content", "embedding", "source", "content_hash")
+
+    def __init__(self, engine, flush_size: Optional[int] = None):
+        self.engine = engine
+        self.flush_size = flush_size or Config.INGEST_FLUSH_SIZE
+        self.rows_written = 0
+        self._buffer = io.BytesIO()
+        self._pending = 0
+        self._copy_sql = f"COPY resources ({', '.join(self.COLUMNS)}) FROM STDIN WITH (FORMAT binary)"
+
+    def _write_row(self, values: List[Optional[bytes]]):
+        out = self._buffer
+        out.write(struct.pack(">h", len(values)))
+        for value in values:
+            if value is None:
+                out.write(struct.pack(">i", -1))
+            else:
+                out.write(struct.pack(">i", len(value)))
+                out.write(value)
+
+    def add(self, category: str, title: str, content: str, embedding,
+            source: Optional[str] = None, content_hash: Optional[str] = None):
+        if self._pending == 0:
+            self._buffer.write(COPY_HEADER)
+        now = encode_timestamptz(datetime.now(timezone.utc))
+        self._write_row([
+            now,
+            now,
+            encode_text(category),
+            encode_text(title),
+            encode_text(content),
+            encode_vector(embedding),
+            encode_text(source),
+            encode_text(content_hash),
+        ])
+        self._pending += 1
+        if self._pending >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered rows in a single transaction."""
+        if self._pending == 0:
+            return
+        self._buffer.write(COPY_TRAILER)
+        payload = self._buffer.getvalue()
+
+        raw = self.engine.raw_connection()
+        try:
+            cur = raw.cursor()
+            if hasattr(cur, "copy_expert"):
+                # psycopg2
+                cur.copy_expert(self._copy_sql, io.BytesIO(payload))
+            else:
+                # psycopg 3
+                with cur.copy(self._copy_sql) as copy:
+                    copy.write(payload)
+            cur.close()
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+        self.rows_written += self._pending
+        logger.info(f"💾 Flushed {self._pending} resources ({len(payload) // 1024} KB)")
+        self._pending = 0
+        self._buffer = io.BytesIO()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
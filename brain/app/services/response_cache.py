@@ -0,0 +1,237 @@
+"""
+Semantic Response Cache
+Serves stored answers for questions whose embedding is close enough to one
+already answered in the same scope (category/subject/year). Entries expire
+after a TTL, the cache is size-bounded (LRU) and everything is dropped when
+the `resources` table changes. With a shared store (multi-worker mode)
+stores and invalidations go through an event log that every worker replays,
+so an answer cached by one worker is served by all of them; async callers
+(alookup, astore, refresh) then do that SQLite I/O in a thread.
+"""
+
+import time
+import base64
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "response_cache"
+# Changes on insert, update, soft delete (deleted_at set) and hard delete (live count drops)
+RESOURCES_FINGERPRINT = text("""
+    SELECT max(id) AS max_id, max(updated_at) AS updated_at, max(deleted_at) AS deleted_at,
+           count(*) FILTER (WHERE deleted_at IS NULL) AS live
+    FROM resources
+""")
+
+
+@dataclass
+class CachedResponse:
+    embedding: np.ndarray  # unit-normalised float32
+    scope: Tuple
+    answer: str
+    sources: List[Dict]
+    expires_at: float  # wall clock, comparable across workers
+    hits: int = field(default=0)
+
+
+def _normalise(embedding) -> np.ndarray:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class ResponseCache:
+    def __init__(self, threshold: Optional[float] = None, ttl_seconds: Optional[float] = None,
+                 max_entries: Optional[int] = None, shared=None):
+        self.threshold = threshold or Config.RESPONSE_CACHE_THRESHOLD
+        self.ttl_seconds = ttl_seconds or Config.RESPONSE_CACHE_TTL_SECONDS
+        self.max_entries = max_entries or Config.RESPONSE_CACHE_SIZE
+        self.enabled = Config.RESPONSE_CACHE_ENABLED
+        self._entries: "OrderedDict[int, CachedResponse]" = OrderedDict()
+        self._matrices: Dict[Tuple, Tuple[List[int], np.ndarray]] = {}  # scope -> (entry ids, stacked embeddings)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self.shared = shared  # app.core.shared_state.SharedStore, or None for a per-process cache
+        self._seq = 0  # last shared event applied
+        self._synced_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _scope_matrix(self, scope: Tuple):
+        cached = self._matrices.get(scope)
+        if cached is None:
+            ids = [eid for eid, entry in self._entries.items() if entry.scope == scope]
+            matrix = np.stack([self._entries[eid].embedding for eid in ids]) if ids else None
+            cached = (ids, matrix)
+            self._matrices[scope] = cached
+        return cached
+
+    def lookup(self, embedding, scope: Tuple) -> Optional[CachedResponse]:
+        if not self.enabled:
+            return None
+        query = _normalise(embedding)
+        now = time.time()
+        with self._lock:
+            self._pull()
+            ids, matrix = self._scope_matrix(scope)
+            if matrix is not None:
+                similarities = matrix @ query
+                best = int(np.argmax(similarities))
+                entry = self._entries.get(ids[best])
+                if similarities[best] >= self.threshold and entry is not None:
+                    if entry.expires_at > now:
+                        self._entries.move_to_end(ids[best])
+                        entry.hits += 1
+                        self.hits += 1
+                        return entry
+                    self._remove(ids[best])
+            self.misses += 1
+        return None
+
+    async def _offload(self, fn, *args):
+        """Call a cache method from async code; with a shared store it runs in a thread."""
+        if self.shared is None:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def alookup(self, embedding, scope: Tuple) -> Optional[CachedResponse]:
+        if not self.enabled:
+            return None
+        return await self._offload(self.lookup, embedding, scope)
+
+    async def astore(self, embedding, scope: Tuple, answer: str, sources: List[Dict]):
+        if self.enabled and answer:
+            await self._offload(self.store, embedding, scope, answer, sources)
+
+    def store(self, embedding, scope: Tuple, answer: str, sources: List[Dict]):
+        if not self.enabled or not answer:
+            return
+        entry = CachedResponse(
+            embedding=_normalise(embedding),
+            scope=scope,
+            answer=answer,
+            sources=sources,
+            expires_at=time.time() + self.ttl_seconds,
+        )
+        with self._lock:
+            if self.shared is None:
+                self._add(entry)
+                return
+            # Shared: the log is the source of truth, our own entry arrives with the replay
+            seq = self.shared.publish(CHANNEL, {
+                "type": "put",
+                "scope": list(scope),
+                "embedding": base64.b64encode(entry.embedding.tobytes()).decode("ascii"),
+                "answer": answer,
+                "sources": sources,
+                "expires_at": entry.expires_at,
+            })
+            if seq % 100 == 0:
+                self.shared.trim(CHANNEL, before_seq=seq - self.max_entries, older_than=time.time() - self.ttl_seconds)
+            self._pull(force=True)
+
+    def _add(self, entry: CachedResponse):
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = entry
+        self._matrices.pop(entry.scope, None)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _clear(self):
+        if self._entries:
+            logger.info(f"🧹 Response cache invalidated ({len(self._entries)} entries)")
+        self._entries.clear()
+        self._matrices.clear()
+        self.invalidations += 1
+
+    def _pull(self, force: bool = False):
+        """Apply shared events newer than the last one seen (at most every SHARED_STATE_SYNC_SECONDS)."""
+        now = time.monotonic()
+        if self.shared is None or (not force and now - self._synced_at < Config.SHARED_STATE_SYNC_SECONDS):
+            return
+        self._synced_at = now
+        try:
+            events = self.shared.read(CHANNEL, after=self._seq)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read shared response cache: {e}")
+            return
+        wall = time.time()
+        for seq, data in events:
+            self._seq = seq
+            if data["type"] == "clear":
+                self._clear()
+            elif data["expires_at"] > wall:
+                self._add(CachedResponse(
+                    embedding=np.frombuffer(base64.b64decode(data["embedding"]), dtype=np.float32),
+                    scope=tuple(data["scope"]),
+                    answer=data["answer"],
+                    sources=data["sources"],
+                    expires_at=data["expires_at"],
+                ))
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is not None:
+            self._matrices.pop(entry.scope, None)
+
+    def invalidate(self):
+        with self._lock:
+            if self.shared is None:
+                self._clear()
+                return
+            seq = self.shared.publish(CHANNEL, {"type": "clear"})
+            self.shared.trim(CHANNEL, before_seq=seq)
+            self._pull(force=True)
+
+    def _fingerprint_changed(self, fingerprint) -> bool:
+        """Record the `resources` fingerprint; True if it differs from the last one seen (by any worker, when shared)."""
+        fingerprint = [str(part) for part in fingerprint]
+        if self.shared is None:
+            previous, self._fingerprint = self._fingerprint, fingerprint
+        else:
+            with self.shared.locked():
+                previous = self.shared.get("resources_fingerprint")
+                self.shared.set("resources_fingerprint", fingerprint)
+        return previous is not None and previous != fingerprint
+
+    async def refresh(self, async_engine):
+        """Drop all entries if `resources` changed since the last check (polled at most every few seconds)."""
+        now = time.monotonic()
+        if not self.enabled or now - self._checked_at < Config.RESPONSE_CACHE_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        try:
+            async with async_engine.connect() as conn:
+                row = (await conn.execute(RESOURCES_FINGERPRINT)).first()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not check resources version: {e}")
+            return
+        if await self._offload(self._fingerprint_changed, (row.max_id, row.updated_at, row.deleted_at, row.live)):
+            await self._offload(self.invalidate)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "threshold": self.threshold,
+            "shared": self.shared is not None,
+        }
@@ -0,0 +1,172 @@
+"""
+Retrieval
+Filtered top-k hybrid (vector + full-text) search over `resources`. Soft-deleted rows are
+always excluded; category/subject/year narrow the candidate set.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.core.config import Config
+from app.services.vector_index import PGVECTOR_VERSION_SQL, search_settings, supported_iterative_scan
+
+logger = logging.getLogger(__name__)
+
+
+def format_embedding(embedding) -> str:
+    """pgvector text literal, e.g. '[0.1,0.2]'."""
+    return "[" + ",".join(map(repr, embedding)) + "]"
+
+
+@dataclass
+class SearchFilters:
+    category: Optional[str] = None
+    subject: Optional[str] = None
+    year: Optional[int] = None
+
+    def where(self) -> Tuple[str, dict]:
+        clauses = ["deleted_at IS NULL", "embedding IS NOT NULL"]
+        params = {}
+        if self.category and self.category != "all":
+            clauses.append("category = :category")
+            params["category"] = self.category
+        if self.subject:
+            clauses.append("subject = :subject")
+            params["subject"] = self.subject
+        if self.year:
+            clauses.append("year = :year")
+            params["year"] = int(self.year)
+        return " AND ".join(clauses), params
+
+
+class Retriever:
+    """
+    Vector search with filters pushed into the index scan.
+
+    Filtered HNSW/IVFFlat scans can return fewer than k rows when the filter is
+    selective, so iterative index scans are enabled per query when the server
+    supports them (pgvector >= 0.8, checked once on the first search);
+    per-category partial indexes (scripts/manage_index.py build --category) make
+    the hottest categories exact and fast. With relaxed ordering the outer query
+    restores the exact distance order.
+
+    In "hybrid" mode (default) a full-text leg over resources.search_tsv runs
+    alongside the vector leg in the same round trip; see build_hybrid_query.
+    """
+
+    def __init__(self, engine, async_engine=None, ef_search: Optional[int] = None, probes: Optional[int] = None,
+                 iterative_scan: Optional[str] = None, mode: Optional[str] = None):
+        self.engine = engine
+        self.async_engine = async_engine
+        self.ef_search = ef_search or Config.HNSW_EF_SEARCH
+        self.probes = probes or Config.IVFFLAT_PROBES
+        self.iterative_scan = iterative_scan or Config.VECTOR_ITERATIVE_SCAN
+        self._scan_mode = None  # iterative_scan the server supports, resolved on first search
+        self._scan_mode_resolved = False
+        self.mode = mode or Config.RETRIEVAL_MODE
+        self.vector_k = Config.RETRIEVAL_VECTOR_K
+        self.lexical_k = Config.RETRIEVAL_LEXICAL_K
+        self.rrf_k = Config.RETRIEVAL_RRF_K
+
+    def _resolve_scan_mode(self, extversion: Optional[str]) -> Optional[str]:
+        """Settle the iterative_scan mode once, from the pgvector version of the first connection."""
+        if not self._scan_mode_resolved:
+            self._scan_mode = supported_iterative_scan(extversion, self.iterative_scan)
+            self._scan_mode_resolved = True
+        return self._scan_mode
+
+    def build_query(self, query_embedding, filters: SearchFilters, limit: int, query_text: Optional[str] = None):
+        if query_text and self.mode == "hybrid":
+            return self.build_hybrid_query(query_embedding, query_text, filters, limit)
+        where, params = filters.where()
+        statement = text(f"""
+            WITH candidates AS MATERIALIZED (
+                SELECT content, category, title, embedding <=> CAST(:embedding AS vector) AS distance
+                FROM resources
+                WHERE {where}
+                ORDER BY embedding <=> CAST(:embedding AS vector)
+                LIMIT :limit
+            )
+            SELECT content, category, title, distance FROM candidates ORDER BY distance
+        """)
+        params.update({"embedding": format_embedding(query_embedding), "limit": limit})
+        return statement, params
+
+    def build_hybrid_query(self, query_embedding, query_text: str, filters: SearchFilters, limit: int):
+        """
+        Vector and full-text legs in one statement, merged with reciprocal rank
+        fusion: score = sum over legs of 1 / (rrf_k + rank). The lexical leg
+        catches exact course codes, formula names and question IDs that the
+        embedding blurs.
+        """
+        where, params = filters.where()
+        statement = text(f"""
+            WITH vector_leg AS MATERIALIZED (
+                SELECT id, embedding <=> CAST(:embedding AS vector) AS distance
+                FROM resources
+                WHERE {where}
+                ORDER BY embedding <=> CAST(:embedding AS vector)
+                LIMIT :vector_k
+            ),
+            vector_ranked AS (
+                SELECT id, row_number() OVER (ORDER BY distance) AS rank FROM vector_leg
+            ),
+            lexical_ranked AS (
+                SELECT id, row_number() OVER (ORDER BY ts_rank_cd(search_tsv, tsq) DESC) AS rank
+                FROM resources, websearch_to_tsquery('english', :query_text) AS tsq
+                WHERE {where} AND search_tsv @@ tsq
+                ORDER BY ts_rank_cd(search_tsv, tsq) DESC
+                LIMIT :lexical_k
+            ),
+            fused AS (
+                SELECT id, sum(1.0 / (:rrf_k + rank)) AS score
+                FROM (
+                    SELECT id, rank FROM vector_ranked
+                    UNION ALL
+                    SELECT id, rank FROM lexical_ranked
+                ) legs
+                GROUP BY id
+            )
+            SELECT r.content, r.category, r.title, f.score
+            FROM fused f JOIN resources r ON r.id = f.id
+            ORDER BY f.score DESC
+            LIMIT :limit
+        """)
+        params.update({
+            "embedding": format_embedding(query_embedding),
+            "query_text": query_text,
+            "vector_k": max(limit, self.vector_k),
+            "lexical_k": max(limit, self.lexical_k),
+            "rrf_k": self.rrf_k,
+            "limit": limit,
+        })
+        return statement, params
+
+    def search(self, query_embedding, category: str = "all", subject: Optional[str] = None,
+               year: Optional[int] = None, limit: int = 5,
+               ef_search: Optional[int] = None, probes: Optional[int] = None,
+               query_text: Optional[str] = None) -> List:
+        filters = SearchFilters(category=category, subject=subject, year=year)
+        statement, params = self.build_query(query_embedding, filters, limit, query_text)
+        with self.engine.begin() as conn:
+            if not self._scan_mode_resolved:
+                self._resolve_scan_mode(conn.execute(PGVECTOR_VERSION_SQL).scalar())
+            conn.execute(*search_settings(ef_search or self.ef_search, probes or self.probes, self._scan_mode))
+            return conn.execute(statement, params).fetchall()
+
+    async def asearch(self, query_embedding, category: str = "all", subject: Optional[str] = None,
+                      year: Optional[int] = None, limit: int = 5,
+                      ef_search: Optional[int] = None, probes: Optional[int] = None,
+                      query_text: Optional[str] = None) -> List:
+        """Same as search() on the async (pooled asyncpg) engine, without blocking the event loop."""
+        filters = SearchFilters(category=category, subject=subject, year=year)
+        statement, params = self.build_query(query_embedding, filters, limit, query_text)
+        async with self.async_engine.begin() as conn:
+            if not self._scan_mode_resolved:
+                self._resolve_scan_mode((await conn.execute(PGVECTOR_VERSION_SQL)).scalar())
+            await conn.execute(*search_settings(ef_search or self.ef_search, probes or self.probes, self._scan_mode))
+            result = await conn.execute(statement, params)
+            return result.fetchall()
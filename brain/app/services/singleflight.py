@@ -0,0 +1,126 @@
+"""
+Single Flight
+Coalesces identical concurrent requests within a worker: while a computation
+for a key is in flight, further callers with the same key attach to it instead
+of starting their own, so a burst of the same question costs one embedding
+call and one LLM call. Streams fan out from one upstream; a subscriber that
+joins late first replays what has been produced so far.
+"""
+
+import json
+import asyncio
+import hashlib
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(query: str, category: str = "all", history: Optional[List] = None, **scope) -> str:
+    """Normalized query (case and whitespace folded) + category + scope + history hash."""
+    history_hash = hashlib.sha256(json.dumps(history or [], sort_keys=True, default=str).encode()).hexdigest()
+    parts = [" ".join(query.lower().split()), category, json.dumps(scope, sort_keys=True, default=str), history_hash]
+    return hashlib.sha256("\x00".join(parts).encode()).hexdigest()
+
+
+def _consume_exception(task: asyncio.Task):
+    """Mark a shared task's exception as retrieved (callers may all have gone)."""
+    if not task.cancelled():
+        task.exception()
+
+
+class _Broadcast:
+    """Items of one upstream stream, buffered for replay, with a wake-up for live subscribers."""
+
+    def __init__(self):
+        self.items: List = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    async def pump(self, upstream: AsyncIterator):
+        try:
+            async for item in upstream:
+                self.items.append(item)
+                self.changed.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self.changed.set()
+
+    async def subscribe(self) -> AsyncIterator:
+        pos = 0
+        while True:
+            while pos < len(self.items):
+                yield self.items[pos]
+                pos += 1
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            self.changed.clear()
+            await self.changed.wait()
+
+
+class SingleFlight:
+    """
+    Per-event-loop in-flight table. The shared work runs as its own task, so
+    a caller that disconnects does not cancel it for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self.started = 0
+        self.joined = 0
+
+    def _live(self, table: Dict, key: str, task_of=lambda value: value):
+        """The in-flight entry for `key`, ignoring one that belongs to another event loop (job threads run their own)."""
+        value = table.get(key)
+        if value is not None and task_of(value).get_loop() is asyncio.get_running_loop():
+            return value
+        return None
+
+    @staticmethod
+    def _forget(table: Dict, key: str, value):
+        if table.get(key) is value:
+            del table[key]
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        """Result of `fn()`, shared with every caller that asks for `key` while it runs."""
+        task = self._live(self._calls, key)
+        if task is None:
+            self.started += 1
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(_consume_exception)
+            task.add_done_callback(lambda _: self._forget(self._calls, key, task))
+        else:
+            self.joined += 1
+            logger.info(f"🔗 {self.name}: joined in-flight request")
+        return await asyncio.shield(task)
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """Items of `fn()`, one upstream per `key` while it runs, fanned out to every subscriber."""
+        broadcast = self._live(self._streams, key, task_of=lambda b: b.task)
+        if broadcast is None:
+            self.started += 1
+            broadcast = self._streams[key] = _Broadcast()
+            broadcast.task = asyncio.ensure_future(broadcast.pump(fn()))
+            broadcast.task.add_done_callback(lambda _: self._forget(self._streams, key, broadcast))
+        else:
+            self.joined += 1
+            logger.info(f"🔗 {self.name}: joined in-flight stream ({len(broadcast.items)} items replayed)")
+        async for item in broadcast.subscribe():
+            yield item
+
+    def stats(self) -> Dict:
+        total = self.started + self.joined
+        return {
+            "started": self.started,
+            "joined": self.joined,
+            "in_flight": len(self._calls) + len(self._streams),
+            "coalesced_rate": round(self.joined / total, 4) if total else 0.0,
+        }
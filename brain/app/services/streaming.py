@@ -0,0 +1,123 @@
+"""
+Streaming
+Typed chat stream events (token, sources, provider, usage, error, done) and
+their wire formats: server-sent events, NDJSON, or the legacy plain text.
+Tiny token deltas are coalesced into flush windows so a stream costs a few
+larger writes instead of one per token, and idle streams get heartbeats so
+proxies keep the connection open.
+"""
+
+import json
+import time
+import asyncio
+from typing import AsyncIterator, Dict, Optional
+
+from app.core.config import Config
+
+FORMATS = {
+    "text": "text/plain; charset=utf-8",
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # nginx: do not buffer the stream
+}
+
+_END = object()
+
+
+def event(type_: str, **data) -> Dict:
+    return {"type": type_, **data}
+
+
+async def coalesce(events: AsyncIterator[Dict], window: Optional[float] = None, max_chars: Optional[int] = None,
+                   heartbeat: Optional[float] = None) -> AsyncIterator[Dict]:
+    """
+    Merge consecutive token events that arrive within `window` seconds (or
+    until `max_chars` are buffered) into one token event. Other events flush
+    the buffer and pass through in order. With no event for `heartbeat`
+    seconds a heartbeat event is emitted.
+    """
+    window = Config.STREAM_FLUSH_SECONDS if window is None else window
+    max_chars = max_chars or Config.STREAM_FLUSH_CHARS
+    heartbeat = heartbeat or Config.STREAM_HEARTBEAT_SECONDS
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for item in events:
+                await queue.put(item)
+        except Exception as e:
+            await queue.put(event("error", message=str(e)))
+        finally:
+            await queue.put(_END)
+
+    task = asyncio.create_task(pump())
+    buffer, size, deadline = [], 0, 0.0
+    try:
+        while True:
+            timeout = max(deadline - time.monotonic(), 0) if buffer else heartbeat
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if buffer:
+                    yield event("token", text="".join(buffer))
+                    buffer, size = [], 0
+                else:
+                    yield event("heartbeat")
+                continue
+
+            if item is not _END and item["type"] == "token":
+                if not item["text"]:
+                    continue
+                if not buffer:
+                    deadline = time.monotonic() + window
+                buffer.append(item["text"])
+                size += len(item["text"])
+                if size >= max_chars:
+                    yield event("token", text="".join(buffer))
+                    buffer, size = [], 0
+                continue
+            if buffer:
+                yield event("token", text="".join(buffer))
+                buffer, size = [], 0
+            if item is _END:
+                break
+            yield item
+    finally:
+        task.cancel()
+
+
+def encode_sse(item: Dict) -> str:
+    if item["type"] == "heartbeat":
+        return ": heartbeat\n\n"
+    data = {k: v for k, v in item.items() if k != "type"}
+    return f"event: {item['type']}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def encode_ndjson(item: Dict) -> str:
+    return json.dumps(item, ensure_ascii=False) + "\n"
+
+
+def encode_text(item: Dict) -> Optional[str]:
+    """Legacy framing: raw token text, errors inline as 'Error: ...', everything else dropped."""
+    if item["type"] == "token":
+        return item["text"]
+    if item["type"] == "error":
+        return f"Error: {item['message']}"
+    return None
+
+
+ENCODERS = {"text": encode_text, "sse": encode_sse, "ndjson": encode_ndjson}
+
+
+async def encode_stream(events: AsyncIterator[Dict], fmt: str) -> AsyncIterator[str]:
+    encoder = ENCODERS[fmt]
+    async for item in coalesce(events):
+        if fmt == "text" and item["type"] == "heartbeat":
+            continue
+        frame = encoder(item)
+        if frame:
+            yield frame
@@ -0,0 +1,178 @@
+"""
+Vector Index Management
+Builds, verifies and tunes the ANN index on resources.embedding (pgvector
+HNSW or IVFFlat with cosine ops), used by the `<=>` similarity search.
+"""
+
+import re
+import math
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "idx_resources_embedding"
+METHODS = ("hnsw", "ivfflat")
+
+
+def _autocommit(engine):
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+    return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def describe_indexes(engine) -> List[Dict]:
+    """List ANN indexes on resources.embedding with their validity and size."""
+    query = text("""
+        SELECT c.relname AS name, am.amname AS method, i.indisvalid AS valid,
+               pg_get_indexdef(i.indexrelid) AS definition,
+               pg_relation_size(i.indexrelid) AS size_bytes
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = c.relam
+        WHERE i.indrelid = 'resources'::regclass AND am.amname IN ('hnsw', 'ivfflat')
+        ORDER BY c.relname
+    """)
+    with engine.connect() as conn:
+        return [dict(r._mapping) for r in conn.execute(query)]
+
+
+def default_lists(row_count: int) -> int:
+    """pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond."""
+    if row_count <= 1_000_000:
+        return max(10, row_count // 1000)
+    return int(math.sqrt(row_count))
+
+
+def build_index(engine, method: Optional[str] = None, m: Optional[int] = None,
+                ef_construction: Optional[int] = None, lists: Optional[int] = None,
+                name: str = INDEX_NAME, where: Optional[str] = None) -> str:
+    """Create the cosine ANN index if it does not exist. Returns the DDL used."""
+    method = method or Config.VECTOR_INDEX_METHOD
+    if method not in METHODS:
+        raise ValueError(f"Unknown index method '{method}', expected one of {METHODS}")
+
+    if method == "hnsw":
+        params = f"m = {int(m or Config.HNSW_M)}, ef_construction = {int(ef_construction or Config.HNSW_EF_CONSTRUCTION)}"
+    else:
+        if not (lists or Config.IVFFLAT_LISTS):
+            with engine.connect() as conn:
+                row_count = conn.execute(text("SELECT count(*) FROM resources WHERE embedding IS NOT NULL")).scalar()
+            lists = default_lists(row_count)
+        params = f"lists = {int(lists or Config.IVFFLAT_LISTS)}"
+
+    ddl = (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON resources "
+        f"USING {method} (embedding vector_cosine_ops) WITH ({params})"
+    )
+    if where:
+        ddl += f" WHERE {where}"
+
+    logger.info(f"🔨 {ddl}")
+    with _autocommit(engine) as conn:
+        conn.execute(text(ddl))
+    return ddl
+
+
+def drop_index(engine, name: Optional[str] = None):
+    with _autocommit(engine) as conn:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name or INDEX_NAME}"))
+
+
+def verify_index(engine) -> Dict:
+    """
+    Check that a valid cosine ANN index exists and that the planner uses it
+    for the top-k similarity query.
+    """
+    indexes = describe_indexes(engine)
+    cosine = [i for i in indexes if "vector_cosine_ops" in i["definition"]]
+    report = {
+        "indexes": indexes,
+        "has_index": bool(cosine),
+        "valid": any(i["valid"] for i in cosine),
+        "used_by_planner": False,
+    }
+    if not report["valid"]:
+        return report
+
+    with engine.connect() as conn:
+        probe = conn.execute(text("SELECT embedding::text FROM resources WHERE embedding IS NOT NULL LIMIT 1")).scalar()
+        if probe is None:
+            return report
+        plan = conn.execute(
+            text("EXPLAIN SELECT id FROM resources ORDER BY embedding <=> CAST(:embedding AS vector) LIMIT 5"),
+            {"embedding": probe},
+        ).fetchall()
+    plan_text = "\n".join(r[0] for r in plan)
+    report["used_by_planner"] = any(i["name"] in plan_text for i in cosine)
+    report["plan"] = plan_text
+    return report
+
+
+PGVECTOR_VERSION_SQL = text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+ITERATIVE_SCAN_MIN_VERSION = (0, 8)
+
+
+def parse_version(version: Optional[str]) -> tuple:
+    """'0.8.0' -> (0, 8, 0); None or unparsable -> ()."""
+    match = re.match(r"\d+(?:\.\d+)*", version or "")
+    return tuple(int(part) for part in match.group(0).split(".")) if match else ()
+
+
+def supported_iterative_scan(extversion: Optional[str], requested: Optional[str]) -> Optional[str]:
+    """
+    The iterative_scan mode to set for this server, or None to leave the GUC
+    alone: when it is "off"/unset, or pgvector is older than 0.8 (where
+    set_config on the unknown parameter would only add a placeholder).
+    """
+    if not requested or requested == "off":
+        return None
+    if parse_version(extversion) < ITERATIVE_SCAN_MIN_VERSION:
+        logger.warning(f"⚠️ pgvector {extversion or 'unknown'} has no iterative index scans; "
+                       f"ignoring iterative_scan={requested}")
+        return None
+    return requested
+
+
+def search_settings(ef_search: Optional[int] = None, probes: Optional[int] = None,
+                    iterative_scan: Optional[str] = None):
+    """
+    Transaction-local recall/latency knobs for one search, as a (statement, params)
+    pair to run before the query inside the same transaction.
+
+    iterative_scan ("relaxed_order", "strict_order") lets filtered scans keep
+    walking the index until enough rows pass the WHERE clause. Only pass it
+    when the server supports it (see supported_iterative_scan); None or "off"
+    leaves the server default.
+    """
+    settings = [
+        "set_config('hnsw.ef_search', :ef_search, true)",
+        "set_config('ivfflat.probes', :probes, true)",
+    ]
+    params = {
+        "ef_search": str(int(ef_search or Config.HNSW_EF_SEARCH)),
+        "probes": str(int(probes or Config.IVFFLAT_PROBES)),
+    }
+    if iterative_scan and iterative_scan != "off":
+        settings += [
+            "set_config('hnsw.iterative_scan', :iterative_scan, true)",
+            "set_config('ivfflat.iterative_scan', :ivf_iterative_scan, true)",
+        ]
+        params["iterative_scan"] = iterative_scan
+        # IVFFlat only supports relaxed ordering
+        params["ivf_iterative_scan"] = "relaxed_order"
+    return text(f"SELECT {', '.join(settings)}"), params
+
+
+def category_index_name(category: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", category.lower()).strip("_")
+    return f"{INDEX_NAME}_{slug}"[:63]
+
+
+def build_category_index(engine, category: str, method: Optional[str] = None, **kwargs) -> str:
+    """Partial ANN index over the live rows of one category, for filtered search."""
+    where = f"category = '{category.replace(chr(39), chr(39) * 2)}' AND deleted_at IS NULL"
+    return build_index(engine, method=method, name=category_index_name(category), where=where, **kwargs)
@@ -1,18 +1,92 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
-from fastapi.responses import StreamingResponse
+import time
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from typing import List, Optional
 import uvicorn
 import os
+import asyncio
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from app.services.chat import ChatService
-from app.services.ingestion import IngestionService
-from app.services.exam_upload import process_pdf_upload
+# Only light modules here: chat (llama_index), ingestion, exam upload (pdfplumber)
+# and the ImageKit SDK are imported when their service is first built, see `services`
+from app.services.embedding_cache import embedding_cache_stats
+from app.services.streaming import FORMATS, STREAM_HEADERS, encode_stream
+from app.services.jobs import QueueFull
+from app.services.pdf_pages import shutdown_pool
+from app.services.vector_index import verify_index, build_index
+from app.core.config import Config
+from app.core.database import get_engine, init_database, dispose_database, pool_stats
+from app.core.lifecycle import ServiceRegistry, parse_names
+import logging
+
+logger = logging.getLogger(__name__)
+
+services = ServiceRegistry()
+services.register("chat", "app.services.chat:ChatService")
+# Ingestion runs on the job pool with fewer concurrent embedding batches, leaving quota for chat
+services.register("ingestion", "app.services.ingestion:IngestionService",
+                  max_in_flight=Config.INGEST_EMBED_MAX_IN_FLIGHT)
+services.register("image_upload", "app.services.image_upload:get_image_pipeline")
+services.register("pdf_pool", "app.services.pdf_pages:get_pool")
+# Built in the lifespan, not at import: spawned pdf_pool workers re-import this module as __mp_main__
+services.register("jobs", "app.services.jobs:JobQueue")
+services.record("import", time.perf_counter() - _import_started)
+
+def check_vector_index():
+    """Warn (or build, with VECTOR_INDEX_AUTOCREATE=true) when similarity search has no ANN index."""
+    try:
+        report = verify_index(get_engine())
+        if report["valid"]:
+            logger.info("✅ ANN index on resources.embedding is valid")
+            return
+        if Config.VECTOR_INDEX_AUTOCREATE:
+            build_index(get_engine())
+        else:
+            logger.warning("⚠️ No valid ANN index on resources.embedding - run: python scripts/manage_index.py build")
+    except Exception as e:
+        logger.warning(f"⚠️ Could not verify ANN index: {e}")
+
+async def warm_services(names):
+    started = time.perf_counter()
+    try:
+        errors = await services.warm(names)
+    except KeyError as e:
+        logger.warning(f"⚠️ WARM_ON_STARTUP: {e.args[0]}")
+        return
+    services.record("warm", time.perf_counter() - started)
+    for name, error in errors.items():
+        if error:
+            logger.warning(f"⚠️ Could not warm {name}: {error}")
+    services.log_profile()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    if Config.WARM_DATABASE_ON_STARTUP:
+        await init_database()
+        await asyncio.to_thread(check_vector_index)
+    await services["jobs"].aget()  # fails jobs orphaned by a restart before new ones are queued
+    services.record("startup", time.perf_counter() - started)
+    services.log_profile()
+    # Heavy services warm in the background; the server accepts requests meanwhile (see /ready)
+    names = parse_names(Config.WARM_ON_STARTUP)
+    warm_task = asyncio.create_task(warm_services(names)) if names else None
+    yield
+    if warm_task:
+        warm_task.cancel()
+    if services["jobs"].built:
+        services["jobs"].instance.shutdown()
+    shutdown_pool()
+    await dispose_database()
 
-app = FastAPI(title="Spirit AI Brain")
+app = FastAPI(title="Spirit AI Brain", lifespan=lifespan)
 
 # Add CORS for admin uploads
 app.add_middleware(
@@ -23,29 +97,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-chat_service = ChatService()
-ingestion_service = IngestionService()
-
 class ChatRequest(BaseModel):
     message: str
     category: str = "all"
     history: list = [] # New: Support history
+    subject: Optional[str] = None
+    year: Optional[int] = None
 
 @app.get("/")
 async def root():
     return {"status": "online", "message": "Spirit Brain is active"}
 
+@app.get("/ready")
+async def ready(warm: Optional[str] = None):
+    """
+    Readiness probe. Builds the services named in `warm` (comma list, default
+    WARM_ON_STARTUP) before answering 200, so a new instance only takes
+    traffic once they are loaded; 503 while any of them fails to build.
+    """
+    names = parse_names(warm) if warm is not None else parse_names(Config.WARM_ON_STARTUP)
+    try:
+        errors = await services.warm(names)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
+    failed = {name: error for name, error in errors.items() if error}
+    if failed:
+        return JSONResponse(status_code=503, content={"ready": False, "errors": failed})
+    return {"ready": True, "warmed": names}
+
+@app.get("/status/startup")
+async def get_startup_profile():
+    return services.profile()
+
 @app.post("/chat")
 async def chat(request: ChatRequest):
     try:
-        response = chat_service.ask(request.message, request.category, request.history)
+        chat_service = await services["chat"].aget()
+        response = await chat_service.ask(request.message, request.category, request.history, subject=request.subject, year=request.year)
         return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/chat/stream")
-async def chat_stream(request: ChatRequest):
-    return StreamingResponse(chat_service.stream_ask(request.message, request.category, request.history), media_type="text/plain")
+async def chat_stream(request: ChatRequest, format: str = Query(default="text")):
+    """
+    format=text (default): raw token text, unchanged for existing clients.
+    format=sse / ndjson: typed events (provider, sources, token, usage, error, done) plus heartbeats.
+    """
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(FORMATS)}")
+    chat_service = await services["chat"].aget()
+    events = chat_service.stream_events(request.message, request.category, request.history, subject=request.subject, year=request.year)
+    return StreamingResponse(encode_stream(events, format), media_type=FORMATS[format], headers=STREAM_HEADERS)
 
 class EmbeddingRequest(BaseModel):
     text: str
@@ -53,39 +156,142 @@ class EmbeddingRequest(BaseModel):
 @app.post("/embeddings")
 async def get_embeddings(request: EmbeddingRequest):
     try:
-        embedding = chat_service.embed_model.get_text_embedding(request.text)
+        chat_service = await services["chat"].aget()
+        embedding = await chat_service.embed_model.aget_text_embedding(request.text)
         return {"embedding": embedding}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/ingest")
-async def ingest(category: str):
-    # This triggers ingestion for the folder matching the category
+class EmbeddingBatchRequest(BaseModel):
+    texts: List[str]
+    format: str = "json"  # json | base64 | binary | npy
+
+@app.post("/embeddings/batch")
+async def get_embeddings_batch(request: EmbeddingBatchRequest):
+    """
+    Embeddings for many texts. Cache hits are served per item; misses go to
+    the provider in EMBED_BATCH_SIZE batches, EMBED_MAX_IN_FLIGHT at a time.
+    Output is float32 (count x dimensions), in input order:
+    - json: {"embeddings": [[...], ...]}
+    - base64: {"dtype": "<f4", "shape": [n, d], "data": "..."}
+    - binary: raw little-endian float32 bytes; shape in X-Embedding-Shape
+    - npy: a NumPy .npy file (np.load)
+    """
+    from app.services.embeddings import (  # numpy loads with chat, not at import
+        EMBEDDING_DTYPE, EMBEDDING_FORMATS, embeddings_payload, encode_matrix, to_matrix,
+    )
+    if request.format not in EMBEDDING_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EMBEDDING_FORMATS)}")
+    if len(request.texts) > Config.EMBED_REQUEST_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"At most {Config.EMBED_REQUEST_MAX_TEXTS} texts per request")
     try:
-        path = f"./data/raw_knowledge/{category}"
-        ingestion_service.ingest_folder(path, category)
-        return {"status": "success", "message": f"Ingested {category}"}
+        chat_service = await services["chat"].aget()
+        embed_model = chat_service.embed_model
+        embeddings, cached = await embed_model.aembed_many(request.texts)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    dimensions = len(embeddings[0]) if embeddings else 0
+    meta = {"model": embed_model.model_name, "count": len(embeddings), "dimensions": dimensions, "cached": cached}
+    if request.format in ("binary", "npy"):
+        headers = {
+            "X-Embedding-Model": meta["model"],
+            "X-Embedding-Shape": f"{len(embeddings)},{dimensions}",
+            "X-Embedding-Dtype": EMBEDDING_DTYPE,
+            "X-Embedding-Cached": str(cached),
+        }
+        body = encode_matrix(to_matrix(embeddings), request.format)
+        return Response(content=body, media_type=EMBEDDING_FORMATS[request.format], headers=headers)
+    return {**meta, **embeddings_payload(embeddings, request.format)}
+
+@app.get("/status/providers")
+async def get_provider_status():
+    # Not built yet means no provider has been called
+    return {"providers": services["chat"].instance.router.status() if services["chat"].built else []}
+
+@app.get("/status/db")
+async def get_db_status():
+    return {"pools": pool_stats()}
+
+@app.get("/cache/embeddings")
+async def get_embedding_cache_stats():
+    return {"caches": embedding_cache_stats()}
+
+@app.get("/cache/responses")
+async def get_response_cache_stats():
+    if not services["chat"].built:
+        return {"enabled": Config.RESPONSE_CACHE_ENABLED, "entries": 0}
+    return services["chat"].instance.response_cache.stats()
+
+@app.get("/status/coalescing")
+async def get_coalescing_stats():
+    """Requests that joined an identical in-flight /chat or /chat/stream (embedding joins: /cache/embeddings)."""
+    if not services["chat"].built:
+        return {"chat": None, "chat_stream": None}
+    chat_service = services["chat"].instance
+    return {"chat": chat_service.ask_flights.stats(), "chat_stream": chat_service.stream_flights.stats()}
+
+@app.get("/jobs")
+async def list_jobs(limit: int = 50):
+    job_queue = await services["jobs"].aget()
+    return {"jobs": await asyncio.to_thread(job_queue.list, limit)}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job_queue = await services["jobs"].aget()
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def run_ingest_job(ctx, path, category):
+    chunks = services["ingestion"].get().ingest_folder(path, category, progress=ctx.report)
+    if services["chat"].built:
+        services["chat"].instance.response_cache.invalidate()
+    return {"category": category, "chunks": chunks}
+
+@app.post("/ingest", status_code=202)
+async def ingest(category: str):
+    # This queues ingestion for the folder matching the category; poll /jobs/{job_id}
+    path = f"./data/raw_knowledge/{category}"
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=404, detail=f"No knowledge folder for {category}")
+    job_queue = await services["jobs"].aget()
+    try:
+        job = await asyncio.to_thread(
+            job_queue.submit, "ingest", run_ingest_job, path, category, params={"category": category}
+        )
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"status": "queued", "job_id": job.id, "message": f"Ingestion of {category} queued"}
+
 # ============================================
 # ADMIN: Exam PDF Upload Endpoint (Temporary)
 # ============================================
-@app.post("/admin/upload-exam")
+async def run_exam_upload_job(ctx, pdf_bytes, subject_name, term, exam_type, force=False):
+    from app.services.exam_upload import process_pdf_upload  # pdfplumber and psycopg2 load with the first upload
+    return await process_pdf_upload(pdf_bytes, subject_name, term, exam_type, progress=ctx.report, force=force)
+
+@app.post("/admin/upload-exam", status_code=202)
 async def upload_exam_pdf(
     file: UploadFile = File(...),
     subject_name: str = Form(...),
     term: str = Form(...),
-    exam_type: str = Form(default="Quiz 1")
+    exam_type: str = Form(default="Quiz 1"),
+    force: bool = Form(default=False)
 ):
     """
     Upload a PDF exam paper. Extracts questions, uploads images to ImageKit,
-    and stores everything in the database.
+    and stores everything in the database. Processing runs as a background
+    job; poll /jobs/{job_id} for progress and the paper id.
     
     - file: PDF file
     - subject_name: e.g., "Mathematics for Data Science 1"
     - term: e.g., "January 2025"
     - exam_type: "Quiz 1", "Quiz 2", or "End Term"
+    - force: re-process even if this exact PDF is already stored; needed to
+      re-file a stored PDF under a different subject, term or exam type (the
+      job result is otherwise a conflict: success false, conflict true)
     """
     try:
         if not file.filename.endswith('.pdf'):
@@ -93,12 +299,24 @@ async def upload_exam_pdf(
         
         pdf_bytes = await file.read()
         
-        result = await process_pdf_upload(pdf_bytes, subject_name, term, exam_type)
+        job_queue = await services["jobs"].aget()
+        job = await asyncio.to_thread(
+            job_queue.submit, "upload_exam", run_exam_upload_job, pdf_bytes, subject_name, term, exam_type, force=force,
+            params={"filename": file.filename, "subject_name": subject_name, "term": term, "exam_type": exam_type},
+        )
         
-        return result
+        return {"status": "queued", "job_id": job.id}
+    except HTTPException:
+        raise
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if Config.WEB_CONCURRENCY > 1:
+        # Worker processes import main themselves (hence the import string); start-up is lazy, see `services`
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=Config.WEB_CONCURRENCY)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
 
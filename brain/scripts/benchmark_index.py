@@ -0,0 +1,153 @@
+"""
+Benchmark ANN search on resources.embedding: recall@k against exact search
+and p50/p99 latency, for a grid of ef_search (HNSW) / probes (IVFFlat) values.
+
+With --grow, the live rows are copied into a scratch table
+(ann_bench.resources, same columns and indexes) and synthetic rows are added
+to it in steps, so the numbers can be compared as the table grows without
+touching the production table, its planner stats or the response caches
+keyed on it. The scratch schema is dropped afterwards (and by the next run,
+if this one was killed).
+
+Usage:
+    python scripts/benchmark_index.py --queries 50 --ef-search 20 40 100
+    python scripts/benchmark_index.py --grow 10000 50000 --probes 1 10 30
+"""
+
+import time
+import random
+import argparse
+import statistics
+from sqlalchemy import create_engine, text
+
+from app.core.config import Config
+from app.services.resource_writer import ResourceWriter
+from app.services.vector_index import search_settings
+
+BENCH_CATEGORY = "__bench__"
+BENCH_SCHEMA = "ann_bench"
+
+SCRATCH_SQL = [
+    f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE",
+    f"CREATE SCHEMA {BENCH_SCHEMA}",
+    f"CREATE TABLE {BENCH_SCHEMA}.resources (LIKE resources INCLUDING ALL)",
+    # Own id sequence, so synthetic rows do not advance the production one
+    f"CREATE SEQUENCE {BENCH_SCHEMA}.resources_id_seq OWNED BY {BENCH_SCHEMA}.resources.id",
+    f"ALTER TABLE {BENCH_SCHEMA}.resources ALTER COLUMN id SET DEFAULT nextval('{BENCH_SCHEMA}.resources_id_seq')",
+    f"""INSERT INTO {BENCH_SCHEMA}.resources (id, created_at, updated_at, category, title, content, embedding)
+        SELECT id, created_at, updated_at, category, title, content, embedding
+        FROM resources WHERE embedding IS NOT NULL AND deleted_at IS NULL""",
+    f"SELECT setval('{BENCH_SCHEMA}.resources_id_seq', coalesce(max(id), 0) + 1, false) FROM {BENCH_SCHEMA}.resources",
+    f"ANALYZE {BENCH_SCHEMA}.resources",
+]
+
+SEARCH_SQL = text("""
+    SELECT id FROM resources
+    ORDER BY embedding <=> CAST(:embedding AS vector)
+    LIMIT :k
+""")
+
+
+def exact_search(engine, embedding, k):
+    with engine.begin() as conn:
+        conn.execute(text("SET LOCAL enable_indexscan = off"))
+        return [r.id for r in conn.execute(SEARCH_SQL, {"embedding": embedding, "k": k})]
+
+
+def ann_search(engine, embedding, k, ef_search, probes):
+    with engine.begin() as conn:
+        conn.execute(*search_settings(ef_search, probes))
+        start = time.perf_counter()
+        ids = [r.id for r in conn.execute(SEARCH_SQL, {"embedding": embedding, "k": k})]
+        return ids, (time.perf_counter() - start) * 1000
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def create_scratch(engine):
+    """Copy the live rows into the scratch table; returns an engine whose `resources` is that table."""
+    with engine.begin() as conn:
+        for statement in SCRATCH_SQL:
+            conn.execute(text(statement))
+    return create_engine(Config.get_sqlalchemy_url(),
+                         connect_args={"options": f"-c search_path={BENCH_SCHEMA},public"})
+
+
+def drop_scratch(engine):
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+
+
+def grow_table(engine, target_rows, dim=768):
+    with engine.connect() as conn:
+        current = conn.execute(text("SELECT count(*) FROM resources WHERE embedding IS NOT NULL")).scalar()
+    to_add = max(0, target_rows - current)
+    with ResourceWriter(engine, flush_size=2000) as writer:
+        for i in range(to_add):
+            vec = [random.gauss(0, 1) for _ in range(dim)]
+            writer.add(BENCH_CATEGORY, f"bench {i}", "", vec)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE resources"))
+    return current + to_add
+
+
+def run(engine, k, queries, ef_values, probe_values):
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT embedding::text AS e FROM resources WHERE embedding IS NOT NULL ORDER BY random() LIMIT :n"),
+            {"n": queries},
+        ).fetchall()
+        total = conn.execute(text("SELECT count(*) FROM resources WHERE embedding IS NOT NULL")).scalar()
+    samples = [r.e for r in rows]
+    if not samples:
+        print("⚠️ No embeddings in resources, nothing to benchmark")
+        return
+
+    truth = [set(exact_search(engine, e, k)) for e in samples]
+    print(f"\n📊 {total} rows, {len(samples)} queries, k={k}")
+    print(f"{'ef_search':>10} {'probes':>7} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+
+    for ef_search in ef_values:
+        for probes in probe_values:
+            recalls, latencies = [], []
+            for e, expected in zip(samples, truth):
+                ids, ms = ann_search(engine, e, k, ef_search, probes)
+                recalls.append(len(expected.intersection(ids)) / max(1, len(expected)))
+                latencies.append(ms)
+            print(f"{ef_search:>10} {probes:>7} {statistics.mean(recalls):>9.3f} "
+                  f"{percentile(latencies, 50):>8.2f} {percentile(latencies, 99):>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark resources.embedding ANN recall and latency")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[Config.HNSW_EF_SEARCH])
+    parser.add_argument("--probes", type=int, nargs="+", default=[Config.IVFFLAT_PROBES])
+    parser.add_argument("--grow", type=int, nargs="*", default=[], help="Row counts to grow the table to (synthetic rows)")
+    args = parser.parse_args()
+
+    engine = create_engine(Config.get_sqlalchemy_url())
+    if not args.grow:
+        run(engine, args.k, args.queries, args.ef_search, args.probes)
+        return
+
+    print(f"🧪 Copying live rows into {BENCH_SCHEMA}.resources...")
+    scratch = create_scratch(engine)
+    try:
+        run(scratch, args.k, args.queries, args.ef_search, args.probes)
+        for target in sorted(args.grow):
+            print(f"\n🌱 Growing table to {target} rows...")
+            grow_table(scratch, target)
+            run(scratch, args.k, args.queries, args.ef_search, args.probes)
+    finally:
+        scratch.dispose()
+        drop_scratch(engine)
+        print(f"\n🧹 Dropped scratch schema '{BENCH_SCHEMA}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark exam PDF parsing: pages/sec for in-process parsing versus the
+page-parallel process pool, for a set of worker counts. Each run parses the
+whole document (text + images); the first parallel run includes pool start-up
+and is reported separately.
+
+Usage:
+    python scripts/benchmark_pdf.py data/end_term.pdf --workers 1 2 4 8 --repeat 3
+"""
+
+import time
+import argparse
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from app.services.pdf_pages import count_pages, parse_pages
+
+
+def run(pdf_bytes, workers, repeat):
+    timings = []
+    if workers <= 1:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parse_pages(pdf_bytes, workers=1)
+            timings.append(time.perf_counter() - start)
+        return None, timings
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        start = time.perf_counter()
+        parse_pages(pdf_bytes, workers=workers, executor=executor)
+        cold = time.perf_counter() - start
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parse_pages(pdf_bytes, workers=workers, executor=executor)
+            timings.append(time.perf_counter() - start)
+    return cold, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark page-parallel PDF parsing")
+    parser.add_argument("pdf", nargs="+", help="PDF files to parse")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for path in args.pdf:
+        with open(path, "rb") as f:
+            pdf_bytes = f.read()
+        pages = count_pages(pdf_bytes)
+        print(f"\n📄 {path}: {pages} pages, {len(pdf_bytes) / 1024:.0f} KiB")
+        print(f"{'workers':>8} {'median s':>10} {'pages/sec':>10} {'speedup':>8} {'cold s':>8}")
+        baseline = None
+        for workers in args.workers:
+            cold, timings = run(pdf_bytes, workers, args.repeat)
+            median = statistics.median(timings)
+            baseline = baseline or median
+            cold_str = f"{cold:.2f}" if cold is not None else "-"
+            print(f"{workers:>8} {median:>10.3f} {pages / median:>10.1f} {baseline / median:>7.2f}x {cold_str:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,11 +19,42 @@ def force_create_table():
         topic TEXT,
         difficulty TEXT,
         metadata JSONB,
-        embedding vector(768)
+        embedding vector(768),
+        source TEXT,
+        content_hash TEXT,
+        search_tsv tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(content, '')), 'B')
+        ) STORED
     );
     
+    -- Columns added after the initial schema (incremental re-ingest)
+    ALTER TABLE resources ADD COLUMN IF NOT EXISTS source TEXT;
+    ALTER TABLE resources ADD COLUMN IF NOT EXISTS content_hash TEXT;
+    -- Full-text leg of hybrid retrieval (adding it rewrites the table once)
+    ALTER TABLE resources ADD COLUMN IF NOT EXISTS search_tsv tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(content, '')), 'B')
+    ) STORED;
+    
     CREATE INDEX IF NOT EXISTS idx_resources_category ON resources(category);
     CREATE INDEX IF NOT EXISTS idx_resources_deleted_at ON resources(deleted_at);
+    CREATE INDEX IF NOT EXISTS idx_resources_search_tsv ON resources USING GIN (search_tsv);
+    CREATE INDEX IF NOT EXISTS idx_resources_updated_at ON resources(updated_at);
+    CREATE INDEX IF NOT EXISTS idx_resources_content_hash ON resources(category, content_hash) WHERE deleted_at IS NULL;
+    
+    -- Exam uploads are idempotent per PDF (term_papers is created by the Go backend's migrations)
+    DO $$
+    BEGIN
+        IF to_regclass('term_papers') IS NOT NULL THEN
+            ALTER TABLE term_papers ADD COLUMN IF NOT EXISTS content_hash TEXT;
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_term_papers_content_hash ON term_papers(content_hash);
+        END IF;
+        -- Re-uploads upsert questions in place, keyed by their id within the paper
+        IF to_regclass('questions') IS NOT NULL THEN
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_paper_question ON questions(paper_id, question_id);
+        END IF;
+    END $$;
     """)
     
     with engine.connect() as conn:
@@ -0,0 +1,77 @@
+"""
+Manage the ANN index on resources.embedding.
+
+Usage:
+    python scripts/manage_index.py status
+    python scripts/manage_index.py build --method hnsw --m 16 --ef-construction 64
+    python scripts/manage_index.py build --method ivfflat --lists 100
+    python scripts/manage_index.py build --category academic
+    python scripts/manage_index.py verify
+    python scripts/manage_index.py drop
+"""
+
+import sys
+import argparse
+from sqlalchemy import create_engine
+
+from app.core.config import Config
+from app.services.vector_index import (
+    build_index, build_category_index, category_index_name, describe_indexes, drop_index, verify_index, METHODS
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the resources.embedding ANN index")
+    parser.add_argument("command", choices=["status", "build", "verify", "drop"])
+    parser.add_argument("--method", choices=METHODS, default=Config.VECTOR_INDEX_METHOD)
+    parser.add_argument("--m", type=int, help="HNSW: max connections per layer")
+    parser.add_argument("--ef-construction", type=int, help="HNSW: candidate list size at build time")
+    parser.add_argument("--lists", type=int, help="IVFFlat: number of lists (default: derived from row count)")
+    parser.add_argument("--category", help="Build/drop a partial index for one category (filtered search)")
+    parser.add_argument("--rebuild", action="store_true", help="Drop the existing index before building")
+    args = parser.parse_args()
+
+    engine = create_engine(Config.get_sqlalchemy_url())
+
+    if args.command == "status":
+        indexes = describe_indexes(engine)
+        if not indexes:
+            print("⚠️ No ANN index on resources.embedding (similarity search is a sequential scan)")
+        for idx in indexes:
+            state = "valid" if idx["valid"] else "INVALID"
+            print(f"📇 {idx['name']} [{idx['method']}, {state}, {idx['size_bytes'] // 1024} KB]\n   {idx['definition']}")
+
+    elif args.command == "build":
+        if args.rebuild:
+            print("🗑️ Dropping existing index...")
+            drop_index(engine, category_index_name(args.category) if args.category else None)
+        print(f"🔨 Building {args.method} index (this can take a while on large tables)...")
+        tuning = {"m": args.m, "ef_construction": args.ef_construction, "lists": args.lists}
+        if args.category:
+            ddl = build_category_index(engine, args.category, method=args.method, **tuning)
+        else:
+            ddl = build_index(engine, method=args.method, **tuning)
+        print(f"✅ {ddl}")
+
+    elif args.command == "verify":
+        report = verify_index(engine)
+        if not report["has_index"]:
+            print("❌ No cosine ANN index found. Run: python scripts/manage_index.py build")
+            sys.exit(1)
+        if not report["valid"]:
+            print("❌ ANN index exists but is INVALID (interrupted concurrent build?). Rebuild with --rebuild")
+            sys.exit(1)
+        if not report["used_by_planner"]:
+            print("⚠️ ANN index is valid but the planner does not use it for the top-k query:")
+            print(report.get("plan", "(table is empty)"))
+            sys.exit(2)
+        print("✅ ANN index is valid and used by the similarity query")
+        print(report["plan"])
+
+    elif args.command == "drop":
+        drop_index(engine, category_index_name(args.category) if args.category else None)
+        print("🗑️ ANN index dropped")
+
+
+if __name__ == "__main__":
+    main()
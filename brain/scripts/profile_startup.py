@@ -0,0 +1,65 @@
+"""
+Report what the API process imports at start-up and what each lazy service
+costs to build. Runs `import main` in a fresh interpreter with -X importtime
+and lists the slowest top-level packages, then (with --warm) builds the named
+services in-process and prints the startup profile served at /status/startup.
+
+Usage:
+    python scripts/profile_startup.py --top 15
+    python scripts/profile_startup.py --warm chat,ingestion
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+import subprocess
+from collections import defaultdict
+
+
+def import_times():
+    """Cumulative import time (ms) of `main`, and per top-level package self time (ms)."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=root, capture_output=True, text=True)
+    packages = defaultdict(float)
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if not fields[0].strip().isdigit():
+            continue  # header row
+        self_us, cumulative_us, name = int(fields[0]), int(fields[1]), fields[2].strip()
+        packages[name.split(".")[0]] += self_us / 1000
+        if name == "main":
+            total = cumulative_us / 1000
+    return total, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile API start-up")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--warm", default="", help="comma list of services to build, e.g. chat,ingestion")
+    args = parser.parse_args()
+
+    total, packages = import_times()
+    print(f"\n📦 import main: {total:.0f}ms")
+    for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{ms:>10.1f}ms  {name}")
+
+    if args.warm:
+        import main as api
+        from app.core.lifecycle import parse_names
+
+        errors = asyncio.run(api.services.warm(parse_names(args.warm)))
+        print("\n🧩 Services")
+        for name, status in api.services.profile()["services"].items():
+            if status["built"]:
+                print(f"{name:>14}  import {status['import_ms']:>8.1f}ms  build {status['build_ms']:>8.1f}ms")
+            elif errors.get(name):
+                print(f"{name:>14}  failed: {errors[name]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -28,11 +28,20 @@ def sync_github_repo(owner, repo, branch="main", category="academic"):
         documents = reader.load_data(branch=branch)
         print(f"✅ Found {len(documents)} academic documents.")
 
+        # Repo-scoped sources: this sync prunes only what it ingested from this repo
+        source_prefix = f"github:{owner}/{repo}/"
+        for document in documents:
+            document.metadata["source"] = source_prefix + document.metadata.get("file_path", document.metadata.get("file_name", ""))
+
         service = IngestionService()
         print("🧠 Feeding the Spirit Brain...")
-        num_chunks = service.ingest_documents(documents, category)
+        num_chunks = service.ingest_documents(documents, category, prune=True, source_prefix=source_prefix)
         
-        print(f"✨ Success! Ingested {num_chunks} chunks into the '{category}' category.")
+        summary = service.last_ingest
+        print(f"✨ Success! Processed {num_chunks} chunks into the '{category}' category: "
+              f"{summary['inserted']} new/changed, {summary['backfilled']} backfilled, {summary['unchanged']} unchanged, "
+              f"{summary['deleted']} removed.")
+        print(f"📈 Embedding throughput: {service.embedding_pipeline.last_stats.chunks_per_sec:.1f} chunks/sec")
     except Exception as e:
         print(f"❌ Sync failed: {str(e)}")
 